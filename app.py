@@ -7,6 +7,7 @@ import numpy as np
 
 import utils.vector_store as vs
 import utils.app_utils as au
+import utils.search_index as si
 import utils.plots as pt
 import utils.db as db
 
@@ -39,9 +40,16 @@ if "all_years" not in st.session_state:
     st.session_state.all_years = False
 
 
+## Max number of paper detail records kept in memory.
+PAPER_DETAILS_CACHE_SIZE = 256
+
+## Run sidebar search against Postgres full-text search instead of the in-memory index.
+USE_DB_SEARCH = False
+
 collection_map = {
     "GTE-Large": "arxiv_vectors",
     "🆕 Cohere V3": "arxiv_vectors_cv3",
+    "🔀 GTE + Cohere": ["arxiv_vectors", "arxiv_vectors_cv3"],
 }
 
 st.markdown(
@@ -73,29 +81,11 @@ st.markdown(
 
 
 def combine_input_data():
-    arxiv_df = db.load_arxiv()
-    summaries_df = db.load_summaries()
-    topics_df = db.load_topics()
-    citations_df = db.load_citations()
-    recursive_summaries_df = db.load_recursive_summaries()
-    markdown_summaries = db.load_summary_markdown()
-    # extended_summaries_dict = (
-    #     extended_summaries_df.groupby("arxiv_code")[["level", "summary"]]
-    #     .apply(lambda g: dict(zip(g["level"], g["summary"])))
-    #     .to_dict()
-    # )
-
-    papers_df = summaries_df.join(arxiv_df, how="left")
-    papers_df = papers_df.join(topics_df, how="left")
-    papers_df = papers_df.join(citations_df, how="left")
-    papers_df = papers_df.join(recursive_summaries_df, how="left")
-    papers_df = papers_df.join(markdown_summaries, how="left")
-    # papers_df["extended_summaries"] = papers_df.index.map(extended_summaries_dict)
+    papers_df = db.load_paper_index()
     papers_df["arxiv_code"] = papers_df.index
     papers_df["url"] = papers_df["arxiv_code"].map(
         lambda l: f"https://arxiv.org/abs/{l}"
     )
-    papers_df.sort_values("published", ascending=False, inplace=True)
     return papers_df
 
 
@@ -135,13 +125,42 @@ def load_data():
     result_df["updated"] = pd.to_datetime(result_df["updated"]).dt.date
     result_df["published"] = pd.to_datetime(result_df["published"].dt.date)
     result_df["category"] = result_df["category"].apply(lambda x: classification_map[x])
-    result_df[["citation_count", "influential_citation_count"]] = result_df[
-        ["citation_count", "influential_citation_count"]
-    ].fillna(0)
+    citation_cols = ["citation_count", "influential_citation_count", "citation_velocity"]
+    result_df[citation_cols] = result_df[citation_cols].fillna(0)
 
     return result_df
 
 
+@st.cache_data(max_entries=PAPER_DETAILS_CACHE_SIZE)
+def get_paper_details(arxiv_code: str):
+    """Fetch long-form paper fields on demand."""
+    return db.load_paper_details(arxiv_code)
+
+
+@st.cache_resource
+def load_search_index():
+    """Build the inverted index over paper text fields (once per process)."""
+    fields_df = db.load_paper_search_fields()
+    return si.PaperSearchIndex().build(fields_df)
+
+
+@st.cache_data(max_entries=100)
+def search_papers_db(search_term: str):
+    return db.search_paper_codes(si.tokenize(search_term))
+
+
+def search_papers(search_term: str):
+    """Ranked (arxiv_code, score) matches of a search term on paper text fields."""
+    if USE_DB_SEARCH:
+        return search_papers_db(search_term)
+    return load_search_index().search(search_term)
+
+
+@st.cache_data(ttl=3600)
+def get_parent_chunk_versions():
+    return db.get_parent_chunk_versions()
+
+
 @st.cache_data
 def get_weekly_summary(date: str):
     return db.get_weekly_summary(date)
@@ -200,6 +219,7 @@ def create_paper_card(paper: Dict, mode="closed", name=""):
     if mode == "open":
         expanded = True
     paper_code = paper["arxiv_code"]
+    paper = {**paper, **get_paper_details(paper_code)}
     try:
         img_cols[0].image(f"imgs/{paper_code}.png", use_column_width=True)
     except:
@@ -339,18 +359,6 @@ def generate_grid_gallery(df, n_cols=5):
                         unsafe_allow_html=True,
                     )
 
-                    last_updated = pd.to_datetime(
-                        df.iloc[i * n_cols + j]["published"]
-                    ).strftime("%b %d, %Y")
-                    # st.markdown(f"{last_updated}")
-                    authors_str = df.iloc[i * n_cols + j]["authors"]
-                    authors_str = (
-                        authors_str[:30] + "..."
-                        if len(authors_str) > 30
-                        else authors_str
-                    )
-                    # st.markdown(authors_str)
-
 
 def create_pagination(items, items_per_page, label="summaries"):
     num_items = len(items)
@@ -437,6 +445,8 @@ def main():
 
     ## Main content.
     full_papers_df = load_data()
+    if not USE_DB_SEARCH:
+        load_search_index()
     st.session_state["papers"] = full_papers_df
 
     ## Filter sidebar.
@@ -480,7 +490,14 @@ def main():
     ## Sort by.
     sort_by = st.sidebar.selectbox(
         "Sort By",
-        ["Published Date", "Last Updated", "Citations", "Random"],
+        [
+            "Published Date",
+            "Last Updated",
+            "Citations",
+            "Trending",
+            "Relevance",
+            "Random",
+        ],
     )
 
     ## Year filter.
@@ -490,6 +507,7 @@ def main():
         papers_df = full_papers_df.copy()
 
     ## Search terms.
+    search_scores = {}
     if len(search_term) > 0 and title_only:
         search_term = search_term.lower()
         papers_df = papers_df[papers_df["title"].str.lower().str.contains(search_term)]
@@ -501,16 +519,8 @@ def main():
         st.session_state.arxiv_code = search_term
     elif len(search_term) > 0:
         search_term = search_term.lower()
-        papers_df = papers_df[
-            papers_df["title"].str.lower().str.contains(search_term)
-            | papers_df["arxiv_code"].str.lower().str.contains(search_term)
-            | papers_df["authors"].str.lower().str.contains(search_term)
-            | papers_df["summary"].str.lower().str.contains(search_term)
-            | papers_df["contribution_title"].str.lower().str.contains(search_term)
-            | papers_df["contribution_content"].str.lower().str.contains(search_term)
-            | papers_df["takeaway_title"].str.lower().str.contains(search_term)
-            | papers_df["takeaway_content"].str.lower().str.contains(search_term)
-        ]
+        search_scores = dict(search_papers(search_term))
+        papers_df = papers_df[papers_df.index.isin(search_scores.keys())]
 
     ## Categories.
     if len(categories) > 0:
@@ -530,6 +540,14 @@ def main():
         papers_df = papers_df.sort_values("published", ascending=False)
     elif sort_by == "Citations":
         papers_df = papers_df.sort_values("citation_count", ascending=False)
+    elif sort_by == "Trending":
+        papers_df = papers_df.sort_values(
+            ["citation_velocity", "citation_count"], ascending=False
+        )
+    elif sort_by == "Relevance" and len(search_scores) > 0:
+        papers_df = papers_df.assign(
+            relevance=papers_df.index.map(search_scores)
+        ).sort_values("relevance", ascending=False)
     elif sort_by == "Random":
         papers_df = papers_df.sample(frac=1)
 
@@ -636,13 +654,18 @@ def main():
         config_cols = st.columns((3, 3, 10))
         embedding_name = config_cols[0]._selectbox(
             label="Embeddings",
-            options=["GTE-Large", "🆕 Cohere V3"],
+            options=list(collection_map.keys()),
             index=1,
         )
 
         # llm_name = config_cols[1]._selectbox(
         #     label="LLM", options=["GPT-3.5-Turbo", "GPT-4"]
         # )
+        chunk_version = config_cols[1]._selectbox(
+            label="Context Chunks",
+            options=get_parent_chunk_versions(),
+            index=0,
+        )
 
         collection_name = collection_map[embedding_name]
         user_question = st.text_area(
@@ -652,13 +675,43 @@ def main():
         chat_btn = st.button("Send", disabled=chat_btn_disabled)
         if chat_btn:
             if user_question != "":
+                timings = {}
+                rag_context = None
                 with st.spinner(
                     "Consulting the GPT maestro, this might take a minute..."
                 ):
-                    response = vs.query_llmpedia(user_question, collection_name)
-                    db.log_qna_db(user_question, response)
-                    st.divider()
+                    cached_response = vs.get_cached_answer(
+                        user_question, collection_name, chunk_version
+                    )
+                    if cached_response is None:
+                        rag_context = vs.retrieve_rag_context(
+                            user_question, collection_name, timings, chunk_version
+                        )
+                st.divider()
+                if cached_response is not None:
+                    response = cached_response
                     st.markdown(response)
+                else:
+                    response = ""
+                    response_placeholder = st.empty()
+                    for response in vs.stream_rag_response(user_question, rag_context):
+                        response_placeholder.markdown(response)
+                    cache_stats = vs.get_query_cache_stats()
+                    st.caption(
+                        f"Retrieval took {timings['total']:.2f}s "
+                        f"(parent fetch {timings['parent_fetch']:.2f}s). "
+                        f"Query embedding cache: {cache_stats['memory_hits']} memory hits, "
+                        f"{cache_stats['db_hits']} DB hits, {cache_stats['misses']} misses."
+                    )
+
+                if len(response.strip()) == 0:
+                    st.error("The GPT maestro did not produce an answer, please retry.")
+                else:
+                    qna_id = db.log_qna_db(user_question, response)
+                    if cached_response is None:
+                        vs.cache_answer(
+                            qna_id, user_question, collection_name, chunk_version
+                        )
 
     with content_tabs[5]:
         # report_sections = [
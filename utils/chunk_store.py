@@ -0,0 +1,81 @@
+from typing import Dict, List, Tuple
+import json
+import os
+
+PROJECT_PATH = os.environ.get("PROJECT_PATH", ".")
+TEXT_PATH = os.path.join(PROJECT_PATH, "data", "arxiv_text")
+SPANS_PATH = os.path.join(PROJECT_PATH, "data", "arxiv_chunk_spans")
+
+
+def normalize_text(doc_txt: str) -> str:
+    """Single-line version of a paper's text; same length as the raw text, so
+    offsets are interchangeable between both."""
+    return doc_txt.replace("\n", " ").replace("\x00", " ")
+
+
+def locate_spans(
+    doc_txt: str, chunk_texts: List[str], chunk_overlap: int
+) -> List[Tuple[int, int]]:
+    """Find (start, end) character offsets of sequential splitter chunks in their
+    source text. Each chunk begins at most `chunk_overlap` chars before the
+    previous one ends, which bounds the search."""
+    doc_txt = normalize_text(doc_txt)
+    spans = []
+    start, end = -1, 0
+    for chunk_text in chunk_texts:
+        chunk_text = normalize_text(chunk_text)
+        found = doc_txt.find(chunk_text, max(start + 1, end - chunk_overlap))
+        start = found if found >= 0 else start + 1
+        end = start + len(chunk_text)
+        spans.append((start, end))
+    return spans
+
+
+def store_spans(arxiv_code: str, version: str, spans: List[Tuple[int, int]]):
+    """Write the chunk spans of a paper for a chunking version."""
+    version_path = os.path.join(SPANS_PATH, version)
+    os.makedirs(version_path, exist_ok=True)
+    with open(os.path.join(version_path, f"{arxiv_code}.json"), "w") as f:
+        json.dump([list(span) for span in spans], f)
+
+
+def load_spans(arxiv_code: str, version: str) -> List[Tuple[int, int]]:
+    """Read the chunk spans of a paper for a chunking version."""
+    with open(os.path.join(SPANS_PATH, version, f"{arxiv_code}.json"), "r") as f:
+        return [tuple(span) for span in json.load(f)]
+
+
+def list_codes(version: str) -> List[str]:
+    """Arxiv codes with stored spans for a chunking version."""
+    version_path = os.path.join(SPANS_PATH, version)
+    if not os.path.exists(version_path):
+        return []
+    return [f.replace(".json", "") for f in os.listdir(version_path)]
+
+
+def delete_spans(arxiv_code: str) -> List[str]:
+    """Remove a paper's spans across all chunking versions."""
+    deleted = []
+    if not os.path.exists(SPANS_PATH):
+        return deleted
+    for version in os.listdir(SPANS_PATH):
+        fname = os.path.join(SPANS_PATH, version, f"{arxiv_code}.json")
+        if os.path.exists(fname):
+            os.remove(fname)
+            deleted.append(fname)
+    return deleted
+
+
+def load_document(arxiv_code: str) -> str:
+    """Read a paper's normalized text (the single stored copy)."""
+    with open(os.path.join(TEXT_PATH, f"{arxiv_code}.txt"), "r") as f:
+        return normalize_text(f.read())
+
+
+def load_chunks(arxiv_code: str, version: str) -> List[Dict]:
+    """Materialize a paper's chunks for a version by slicing its text."""
+    doc_txt = load_document(arxiv_code)
+    return [
+        {"chunk_id": chunk_id, "start": start, "end": end, "text": doc_txt[start:end]}
+        for chunk_id, (start, end) in enumerate(load_spans(arxiv_code, version))
+    ]
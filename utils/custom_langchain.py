@@ -1,9 +1,18 @@
-from langchain.vectorstores import PGVector
 from langchain.embeddings import CohereEmbeddings
+from langchain.schema.embeddings import Embeddings
+from langchain.schema.vectorstore import VectorStore
+from langchain.docstore.document import Document
 from typing import List, Iterable, Optional, Any
 from langchain.output_parsers.openai_functions import PydanticOutputFunctionsParser
+from collections import OrderedDict
 import demjson3 as demjson
+import threading
+import hashlib
 import copy
+import re
+
+import utils.db as db
+from utils.vector_index import LocalVectorIndex
 
 
 def clean_fnc_call(json_str):
@@ -42,25 +51,176 @@ class NewCohereEmbeddings(CohereEmbeddings):
         return [list(map(float, e)) for e in embeddings.embeddings]
 
 
-class NewPGVector(PGVector):
+def normalize_query(text: str) -> str:
+    """Lowercase and collapse whitespace so trivially different questions share a key."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper caching query vectors in memory (LRU) and in Postgres."""
+
+    def __init__(self, embeddings: Embeddings, model_name: str, max_size: int = 1024):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+    def embed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts, **kwargs)
+
+    def embed_query(self, text: str) -> List[float]:
+        text_hash = hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+        with self.lock:
+            if text_hash in self.cache:
+                self.cache.move_to_end(text_hash)
+                self.stats["memory_hits"] += 1
+                return self.cache[text_hash]
+
+        embedding = db.get_query_embedding(self.model_name, text_hash)
+        stat = "db_hits" if embedding is not None else "misses"
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            db.insert_query_embedding(self.model_name, text_hash, embedding)
+
+        with self.lock:
+            self.stats[stat] += 1
+            self.cache[text_hash] = embedding
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return embedding
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters for the query embedding cache."""
+        with self.lock:
+            return {**self.stats, "memory_size": len(self.cache)}
+
+
+class CachedDocumentEmbeddings(Embeddings):
+    """Embeddings wrapper reusing document vectors by (model, sha256 of text),
+    so identical chunks are never re-embedded across collections or re-runs."""
+
+    def __init__(self, embeddings: Embeddings, model_name: str):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def embed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        text_hashes = [hashlib.sha256(t.encode("utf-8")).hexdigest() for t in texts]
+        cached = db.get_cached_embeddings(self.model_name, set(text_hashes))
+        missing = {h: t for h, t in zip(text_hashes, texts) if h not in cached}
+
+        if len(missing) > 0:
+            new_embeddings = self.embeddings.embed_documents(
+                list(missing.values()), **kwargs
+            )
+            new_embeddings = dict(zip(missing.keys(), new_embeddings))
+            db.insert_cached_embeddings(self.model_name, new_embeddings)
+            cached.update(new_embeddings)
+
+        with self.lock:
+            self.stats["hits"] += len(texts) - len(missing)
+            self.stats["misses"] += len(missing)
+        return [cached[h] for h in text_hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters (in documents) for the embedding cache."""
+        with self.lock:
+            return dict(self.stats)
+
+
+class LocalVectorStore(VectorStore):
+    """Read-only vector store searching a local (memory-mapped) index; chunk text is
+    sliced from the chunk store for the top hits only."""
+
+    def __init__(
+        self,
+        collection_name: str,
+        embedding_function: Embeddings,
+        n_probe: Optional[int] = None,
+    ):
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.n_probe = n_probe
+        self.index = LocalVectorIndex(collection_name)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        raise NotImplementedError("Local indexes are built by the k1_vector_index stage.")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, **kwargs: Any):
+        raise NotImplementedError("Local indexes are built by the k1_vector_index stage.")
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        rows = [row for row, _ in self.index.search(embedding, k=k, n_probe=self.n_probe)]
+        keys = self.index.metadata.iloc[rows]
+        chunk_ids = list(zip(keys["arxiv_code"], keys["chunk_id"].astype(int)))
+        texts = db.get_chunk_texts(chunk_ids)
+        return [
+            Document(
+                page_content=texts[chunk_id],
+                metadata={"arxiv_code": chunk_id[0], "chunk_id": chunk_id[1]},
+            )
+            for chunk_id in chunk_ids
+            if chunk_id in texts
+        ]
+
+
+class TypedPGVectorStore(VectorStore):
+    """Read-only vector store over a collection's typed pgvector table (ANN indexed)."""
+
+    def __init__(self, collection_name: str, embedding_function: Embeddings):
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
     def add_texts(
         self,
         texts: Iterable[str],
         metadatas: Optional[List[dict]] = None,
-        ids: Optional[List[str]] = None,
         **kwargs: Any,
     ) -> List[str]:
-        """Run more texts through the embeddings and add to the vectorstore.
-
-        Args:
-            texts: Iterable of strings to add to the vectorstore.
-            metadatas: Optional list of metadatas associated with the texts.
-            kwargs: vectorstore specific parameters
-
-        Returns:
-            List of ids from adding the texts into the vectorstore.
-        """
-        embeddings = self.embedding_function.embed_documents(list(texts), input_type="search_document")
-        return self.add_embeddings(
-            texts=texts, embeddings=embeddings, metadatas=metadatas, ids=ids, **kwargs
-        )
\ No newline at end of file
+        raise NotImplementedError("Embeddings are written by the k0_rag_embedder stage.")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, **kwargs: Any):
+        raise NotImplementedError("Embeddings are written by the k0_rag_embedder stage.")
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        rows = db.search_embeddings(self.collection_name, embedding, k=k)
+        return [
+            Document(
+                page_content=chunk_text,
+                metadata={"arxiv_code": arxiv_code, "chunk_id": chunk_id},
+            )
+            for arxiv_code, chunk_id, chunk_text, _ in rows
+        ]
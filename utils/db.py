@@ -1,9 +1,12 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, inspect, text
 from datetime import datetime
 import streamlit as st
 import pandas as pd
-import psycopg2
+import numpy as np
+import threading
 import uuid
+import time
+import io
 import os
 
 try:
@@ -18,12 +21,98 @@ except:
     db_params = {**st.secrets["postgres"]}
 
 
-database_url = f"postgresql+psycopg2://{db_params['user']}:{db_params['password']}@{db_params['host']}:{db_params['port']}/{db_params['dbname']}"
+## Connection pool settings (shared by the app and all workflow stages).
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+POOL_MAX_OVERFLOW = int(os.environ.get("DB_POOL_MAX_OVERFLOW", 10))
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+
+
+def get_db_url(params: dict = db_params) -> str:
+    """Build a SQLAlchemy URL from a dict of connection params."""
+    return (
+        f"postgresql+psycopg2://{params['user']}:{params['password']}"
+        f"@{params['host']}:{params['port']}/{params['dbname']}"
+    )
+
+
+database_url = get_db_url(db_params)
+
+## Embedding dimension of each vector collection.
+COLLECTION_DIMS = {
+    "arxiv_vectors": 1024,
+    "arxiv_vectors_cv3": 1024,
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+_pool_stats = {}
+_upload_stats = {}
+_upload_stats_lock = threading.Lock()
+## (db_url, table_name) of tables known to exist, to skip the catalog lookup.
+_known_tables = set()
+
+
+def get_engine(db_url: str = database_url):
+    """Get the process-wide pooled engine for a DB URL, creating it on first use."""
+    if db_url in _engines:
+        return _engines[db_url]
+    with _engines_lock:
+        if db_url in _engines:
+            return _engines[db_url]
+        engine = create_engine(
+            db_url,
+            pool_size=POOL_SIZE,
+            max_overflow=POOL_MAX_OVERFLOW,
+            pool_pre_ping=True,
+            pool_recycle=POOL_RECYCLE,
+        )
+        stats = {"connects": 0, "checkouts": 0}
+
+        @event.listens_for(engine, "connect")
+        def _on_connect(dbapi_conn, conn_record):
+            stats["connects"] += 1
+
+        @event.listens_for(engine, "checkout")
+        def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+            stats["checkouts"] += 1
+
+        _pool_stats[db_url] = stats
+        _engines[db_url] = engine
+    return _engines[db_url]
+
+
+def get_pool_stats(db_url: str = database_url) -> dict:
+    """Connection reuse metrics for the pooled engine of a DB URL."""
+    if db_url not in _engines:
+        return {}
+    pool = _engines[db_url].pool
+    stats = _pool_stats[db_url]
+    checkouts = stats["checkouts"]
+    reused = max(checkouts - stats["connects"], 0)
+    return {
+        "connects": stats["connects"],
+        "checkouts": checkouts,
+        "reused": reused,
+        "reuse_ratio": reused / checkouts if checkouts else 0.0,
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
+def print_pool_stats(db_url: str = database_url):
+    """Print the connection reuse of the pooled engine (end of workflow stages)."""
+    stats = get_pool_stats(db_url)
+    if stats:
+        print(
+            f"DB pool: {stats['checkouts']} checkouts over {stats['connects']} "
+            f"connections ({stats['reuse_ratio']:.0%} reused)."
+        )
 
 
 def log_error_db(error):
     """Log error in DB along with streamlit app state."""
-    engine = create_engine(database_url)
+    engine = get_engine()
     with engine.begin() as conn:
         error_id = str(uuid.uuid4())
         tstp = pd.to_datetime("now").strftime("%Y-%m-%d %H:%M:%S")
@@ -46,7 +135,7 @@ def log_error_db(error):
 
 def log_qna_db(user_question, response):
     """Log Q&A in DB along with streamlit app state."""
-    engine = create_engine(database_url)
+    engine = get_engine()
     with engine.begin() as conn:
         qna_id = str(uuid.uuid4())
         tstp = pd.to_datetime("now").strftime("%Y-%m-%d %H:%M:%S")
@@ -65,12 +154,238 @@ def log_qna_db(user_question, response):
                 "response": str(response),
             },
         )
+    return qna_id
+
+
+def create_embedding_cache_table():
+    """Create the content-addressed document embedding cache table."""
+    with get_engine().begin() as conn:
+        conn.execute(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                embedding BYTEA NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            );
+            """
+            )
+        )
     return True
 
 
+def get_cached_embeddings(model: str, text_hashes: list):
+    """Get {text_hash: embedding} of the cached document embeddings among `text_hashes`."""
+    with get_engine().begin() as conn:
+        query = text(
+            """
+            SELECT text_hash, embedding
+            FROM embedding_cache
+            WHERE model = :model AND text_hash = ANY(:text_hashes);
+            """
+        )
+        result = conn.execute(query, {"model": model, "text_hashes": list(text_hashes)})
+        return {
+            row[0]: np.frombuffer(row[1], dtype=np.float16).astype(np.float32).tolist()
+            for row in result.fetchall()
+        }
+
+
+def insert_cached_embeddings(model: str, embeddings_map: dict):
+    """Store {text_hash: embedding} document embeddings (as float16) in the cache."""
+    if len(embeddings_map) == 0:
+        return True
+    with get_engine().begin() as conn:
+        query = text(
+            """
+            INSERT INTO embedding_cache (model, text_hash, embedding)
+            VALUES (:model, :text_hash, :embedding)
+            ON CONFLICT (model, text_hash) DO NOTHING;
+            """
+        )
+        conn.execute(
+            query,
+            [
+                {
+                    "model": model,
+                    "text_hash": text_hash,
+                    "embedding": np.asarray(embedding, dtype=np.float16).tobytes(),
+                }
+                for text_hash, embedding in embeddings_map.items()
+            ],
+        )
+    return True
+
+
+def create_query_embeddings_table():
+    """Create the persistent query embedding cache table."""
+    with get_engine().begin() as conn:
+        conn.execute(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                embedding BYTEA NOT NULL,
+                tstp TIMESTAMP NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            );
+            """
+            )
+        )
+    return True
+
+
+def get_query_embedding(model: str, text_hash: str):
+    """Get a cached query embedding (or None) by model and normalized text hash."""
+    with get_engine().begin() as conn:
+        query = text(
+            """
+            SELECT embedding
+            FROM query_embeddings
+            WHERE model = :model AND text_hash = :text_hash;
+            """
+        )
+        result = conn.execute(query, {"model": model, "text_hash": text_hash})
+        row = result.fetchone()
+    if row is None:
+        return None
+    return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+
+def insert_query_embedding(model: str, text_hash: str, embedding: list):
+    """Store a query embedding in the persistent cache."""
+    with get_engine().begin() as conn:
+        query = text(
+            """
+            INSERT INTO query_embeddings (model, text_hash, embedding, tstp)
+            VALUES (:model, :text_hash, :embedding, :tstp)
+            ON CONFLICT (model, text_hash) DO NOTHING;
+            """
+        )
+        conn.execute(
+            query,
+            {
+                "model": model,
+                "text_hash": text_hash,
+                "embedding": np.asarray(embedding, dtype=np.float32).tobytes(),
+                "tstp": datetime.now(),
+            },
+        )
+    return True
+
+
+## Dimension of the question embeddings (from the collection models, see COLLECTION_DIMS).
+QNA_EMBEDDING_DIM = 1024
+
+
+def create_qna_embeddings_table():
+    """Create the table of question embeddings backing the semantic answer cache."""
+    with get_engine().begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
+        ## Earlier versions stored raw float32 bytes; those cache entries are dropped.
+        result = conn.execute(
+            text(
+                """
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'qna_embeddings' AND column_name = 'embedding';
+            """
+            )
+        )
+        row = result.fetchone()
+        if row is not None and row[0] == "bytea":
+            conn.execute(text("DROP TABLE qna_embeddings;"))
+        conn.execute(
+            text(
+                f"""
+            CREATE TABLE IF NOT EXISTS qna_embeddings (
+                qna_id TEXT PRIMARY KEY,
+                collection_name TEXT NOT NULL,
+                corpus_version TEXT NOT NULL,
+                embedding VECTOR({QNA_EMBEDDING_DIM}) NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS qna_embeddings_lookup_idx
+            ON qna_embeddings (collection_name, corpus_version);
+            """
+            )
+        )
+    return True
+
+
+def insert_qna_embedding(
+    qna_id: str, collection_name: str, corpus_version: str, embedding: list
+):
+    """Store the question embedding of a logged Q&A."""
+    with get_engine().begin() as conn:
+        query = text(
+            """
+            INSERT INTO qna_embeddings (qna_id, collection_name, corpus_version, embedding)
+            VALUES (:qna_id, :collection_name, :corpus_version, CAST(:embedding AS vector));
+            """
+        )
+        conn.execute(
+            query,
+            {
+                "qna_id": qna_id,
+                "collection_name": collection_name,
+                "corpus_version": corpus_version,
+                "embedding": str(list(map(float, embedding))),
+            },
+        )
+    return True
+
+
+def get_nearest_qna(collection_name: str, corpus_version: str, embedding: list):
+    """Get (response, cosine similarity) of the logged Q&A closest to a question
+    embedding for a collection and corpus snapshot, or None if there is none."""
+    with get_engine().begin() as conn:
+        query = text(
+            """
+            SELECT q.response, 1 - (e.embedding <=> CAST(:embedding AS vector)) AS similarity
+            FROM qna_embeddings e
+            JOIN qna_logs q ON q.qna_id = e.qna_id
+            WHERE e.collection_name = :collection_name
+            AND e.corpus_version = :corpus_version
+            AND length(trim(q.response)) > 0
+            ORDER BY e.embedding <=> CAST(:embedding AS vector)
+            LIMIT 1;
+            """
+        )
+        result = conn.execute(
+            query,
+            {
+                "collection_name": collection_name,
+                "corpus_version": corpus_version,
+                "embedding": str(list(map(float, embedding))),
+            },
+        )
+        row = result.fetchone()
+    if row is None:
+        return None
+    return row[0], float(row[1])
+
+
+## The papers view only changes on refresh, so its version is re-read at most this often.
+CORPUS_VERSION_TTL = int(os.environ.get("CORPUS_VERSION_TTL", 300))
+_corpus_version = {"value": None, "tstp": 0.0}
+
+
+def get_corpus_version():
+    """Identifier of the current paper corpus snapshot (changes when the papers view is refreshed)."""
+    if time.time() - _corpus_version["tstp"] < CORPUS_VERSION_TTL:
+        return _corpus_version["value"]
+    with get_engine().begin() as conn:
+        result = conn.execute(text("SELECT COUNT(*), MAX(published) FROM papers;"))
+        count, max_published = result.fetchone()
+    _corpus_version["value"] = f"{count}_{max_published}"
+    _corpus_version["tstp"] = time.time()
+    return _corpus_version["value"]
+
+
 def insert_recursive_summary(arxiv_code, summary):
     """Insert data into recursive_summary table in DB."""
-    engine = create_engine(database_url)
+    engine = get_engine()
 
     with engine.begin() as conn:
         query = text(
@@ -88,7 +403,7 @@ def insert_recursive_summary(arxiv_code, summary):
 
 def load_arxiv():
     query = "SELECT * FROM arxiv_details;"
-    conn = create_engine(database_url)
+    conn = get_engine()
     arxiv_df = pd.read_sql(query, conn)
     arxiv_df.set_index("arxiv_code", inplace=True)
     return arxiv_df
@@ -96,7 +411,7 @@ def load_arxiv():
 
 def load_summaries():
     query = "SELECT * FROM summaries;"
-    conn = create_engine(database_url)
+    conn = get_engine()
     summaries_df = pd.read_sql(query, conn)
     summaries_df.set_index("arxiv_code", inplace=True)
     summaries_df.drop(columns=["tstp"], inplace=True)
@@ -105,7 +420,7 @@ def load_summaries():
 
 def load_recursive_summaries():
     query = "SELECT * FROM recursive_summaries;"
-    conn = create_engine(database_url)
+    conn = get_engine()
     recursive_summaries_df = pd.read_sql(query, conn)
     recursive_summaries_df.set_index("arxiv_code", inplace=True)
     recursive_summaries_df.rename(
@@ -117,7 +432,7 @@ def load_recursive_summaries():
 
 def load_summary_notes():
     query = "SELECT * FROM summary_notes;"
-    conn = create_engine(database_url)
+    conn = get_engine()
     extended_summaries_df = pd.read_sql(query, conn)
     extended_summaries_df.set_index("arxiv_code", inplace=True)
     return extended_summaries_df
@@ -125,7 +440,7 @@ def load_summary_notes():
 
 def load_summary_markdown():
     query = "SELECT * FROM summary_markdown;"
-    conn = create_engine(database_url)
+    conn = get_engine()
     markdown_summaries_df = pd.read_sql(query, conn)
     markdown_summaries_df.set_index("arxiv_code", inplace=True)
     markdown_summaries_df.rename(columns={"summary": "markdown_notes"}, inplace=True)
@@ -135,7 +450,7 @@ def load_summary_markdown():
 
 def load_topics():
     query = "SELECT * FROM topics;"
-    conn = create_engine(database_url)
+    conn = get_engine()
     topics_df = pd.read_sql(query, conn)
     topics_df.set_index("arxiv_code", inplace=True)
     return topics_df
@@ -143,188 +458,847 @@ def load_topics():
 
 def load_citations():
     query = "SELECT * FROM semantic_details;"
-    conn = create_engine(database_url)
+    conn = get_engine()
     citations_df = pd.read_sql(query, conn)
     citations_df.set_index("arxiv_code", inplace=True)
     citations_df.drop(columns=["paper_id"], inplace=True)
     return citations_df
 
 
-def get_arxiv_parent_chunk_ids(chunk_ids: list):
-    """Get (arxiv_code, parent_id) for a list of (arxiv_code, child_id) tuples."""
-    ## ToDo: Improve version param.
-    engine = create_engine(database_url)
-    with engine.begin() as conn:
-        # Prepare a list of conditions for matching pairs of arxiv_code and child_id
-        conditions = " OR ".join(
-            [
-                f"(arxiv_code = '{arxiv_code}' AND child_id = {child_id})"
-                for arxiv_code, child_id in chunk_ids
-            ]
+## Weighted full-text search document over the `papers` view (backed by a GIN index).
+## A single unstemmed config is used for documents and queries, so prefix terms
+## match the same way as in the in-memory search index.
+PAPERS_SEARCH_CONFIG = "simple"
+PAPERS_SEARCH_VECTOR = f"""(
+    setweight(to_tsvector('{PAPERS_SEARCH_CONFIG}', coalesce(arxiv_code, '')), 'A')
+    || setweight(to_tsvector('{PAPERS_SEARCH_CONFIG}', coalesce(title, '')), 'A')
+    || setweight(to_tsvector('{PAPERS_SEARCH_CONFIG}', coalesce(authors, '')), 'B')
+    || setweight(to_tsvector('{PAPERS_SEARCH_CONFIG}', coalesce(contribution_title, '') || ' ' || coalesce(takeaway_title, '')), 'B')
+    || setweight(to_tsvector('{PAPERS_SEARCH_CONFIG}', coalesce(summary, '') || ' ' || coalesce(contribution_content, '') || ' ' || coalesce(takeaway_content, '')), 'C')
+)"""
+
+
+def create_papers_view():
+    """Create the `papers` materialized view with the columns rendered by the app
+    (recreated if it predates the citation velocity column)."""
+    with get_engine().begin() as conn:
+        result = conn.execute(
+            text(
+                """
+            SELECT 1 FROM pg_attribute
+            WHERE attrelid = to_regclass('papers') AND attname = 'citation_velocity';
+            """
+            )
+        )
+        if result.fetchone() is None:
+            conn.execute(text("DROP MATERIALIZED VIEW IF EXISTS papers;"))
+        conn.execute(
+            text(
+                """
+            CREATE MATERIALIZED VIEW IF NOT EXISTS papers AS
+            SELECT DISTINCT ON (s.arxiv_code)
+                   s.arxiv_code, d.title, d.authors, d.published, d.updated,
+                   d.summary, d.arxiv_comment, s.category, t.topic, t.dim1, t.dim2,
+                   sd.citation_count, sd.influential_citation_count,
+                   cl.citation_velocity,
+                   s.contribution_title, s.contribution_content,
+                   s.takeaway_title, s.takeaway_content, s.takeaway_example,
+                   s.novelty_score, s.novelty_analysis,
+                   s.technical_score, s.technical_analysis,
+                   s.enjoyable_score, s.enjoyable_analysis,
+                   rs.summary AS recursive_summary, sm.summary AS markdown_notes
+            FROM summaries s
+            LEFT JOIN arxiv_details d ON d.arxiv_code = s.arxiv_code
+            LEFT JOIN topics t ON t.arxiv_code = s.arxiv_code
+            LEFT JOIN semantic_details sd ON sd.arxiv_code = s.arxiv_code
+            LEFT JOIN citation_latest cl ON cl.arxiv_code = s.arxiv_code
+            LEFT JOIN recursive_summaries rs ON rs.arxiv_code = s.arxiv_code
+            LEFT JOIN summary_markdown sm ON sm.arxiv_code = s.arxiv_code
+            ORDER BY s.arxiv_code, rs.tstp DESC NULLS LAST, sm.tstp DESC NULLS LAST;
+            """
+            )
+        )
+        conn.execute(
+            text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS papers_arxiv_code_idx ON papers (arxiv_code);"
+            )
+        )
+        ## Replaced by the single-config index below.
+        conn.execute(text("DROP INDEX IF EXISTS papers_search_idx;"))
+        conn.execute(
+            text(
+                f"CREATE INDEX IF NOT EXISTS papers_search_simple_idx ON papers USING GIN ({PAPERS_SEARCH_VECTOR});"
+            )
+        )
+    return True
+
+
+def refresh_papers_view(concurrently=True):
+    """Refresh the `papers` materialized view (without blocking readers by default)."""
+    mode = "CONCURRENTLY " if concurrently else ""
+    with get_engine().begin() as conn:
+        conn.execute(text(f"REFRESH MATERIALIZED VIEW {mode}papers;"))
+    return True
+
+
+def load_paper_index():
+    """Load the slim paper index (no long-form text) used for browsing and filtering."""
+    query = """
+        SELECT arxiv_code, title, published, updated, category, topic,
+               citation_count, influential_citation_count, citation_velocity,
+               dim1, dim2
+        FROM papers
+        ORDER BY published DESC;
+    """
+    conn = get_engine()
+    index_df = pd.read_sql(query, conn)
+    index_df.set_index("arxiv_code", inplace=True)
+    return index_df
+
+
+def load_paper_details(arxiv_code: str):
+    """Load the long-form fields of a single paper for its card."""
+    with get_engine().begin() as conn:
+        query = text(
+            """
+            SELECT authors, summary, arxiv_comment,
+                   contribution_title, contribution_content,
+                   takeaway_title, takeaway_content, takeaway_example,
+                   novelty_score, novelty_analysis,
+                   technical_score, technical_analysis,
+                   enjoyable_score, enjoyable_analysis,
+                   recursive_summary, markdown_notes
+            FROM papers
+            WHERE arxiv_code = :arxiv_code;
+            """
         )
+        result = conn.execute(query, {"arxiv_code": arxiv_code})
+        row = result.mappings().fetchone()
+    return dict(row) if row else {}
+
+
+def load_paper_search_fields():
+    """Load the text fields indexed by the sidebar search."""
+    query = """
+        SELECT arxiv_code, title, authors, summary,
+               contribution_title, contribution_content,
+               takeaway_title, takeaway_content
+        FROM papers;
+    """
+    conn = get_engine()
+    fields_df = pd.read_sql(query, conn)
+    fields_df.set_index("arxiv_code", inplace=True)
+    return fields_df
+
+
+def search_paper_codes(terms: list):
+    """Get (arxiv_code, rank) of papers matching all search terms (as prefixes), best first."""
+    if len(terms) == 0:
+        return []
+    ts_query = " & ".join([f"'{term}':*" for term in terms])
+    with get_engine().begin() as conn:
         query = text(
             f"""
-            SELECT DISTINCT arxiv_code, parent_id
-            FROM arxiv_chunk_map
-            WHERE ({conditions})
-            AND version = '10000_1000';
---             AND version = '5000_500';
+            SELECT arxiv_code, ts_rank({PAPERS_SEARCH_VECTOR}, to_tsquery('{PAPERS_SEARCH_CONFIG}', :ts_query)) AS rank
+            FROM papers
+            WHERE {PAPERS_SEARCH_VECTOR} @@ to_tsquery('{PAPERS_SEARCH_CONFIG}', :ts_query)
+            ORDER BY rank DESC;
             """
         )
-        result = conn.execute(query)
-        parent_ids = result.fetchall()
-    return parent_ids
+        result = conn.execute(query, {"ts_query": ts_query})
+        return [(row[0], row[1]) for row in result.fetchall()]
 
 
-def get_arxiv_chunks(chunk_ids: list, source="child"):
-    """Get chunks with metadata for a list of (arxiv_code, chunk_id) tuples."""
-    engine = create_engine(database_url)
-    source_table = "arxiv_chunks" if source == "child" else "arxiv_parent_chunks"
-    with engine.begin() as conn:
-        # Prepare a list of conditions for matching pairs of arxiv_code and chunk_id
-        conditions = " OR ".join(
-            [
-                f"(p.arxiv_code = '{arxiv_code}' AND p.chunk_id = {chunk_id})"
-                for arxiv_code, chunk_id in chunk_ids
-            ]
+def create_chunk_indexes():
+    """Create the child-to-parent lookup index (spans are covered by their PK)."""
+    with get_engine().begin() as conn:
+        conn.execute(
+            text(
+                """
+            CREATE INDEX IF NOT EXISTS arxiv_chunk_map_version_idx
+            ON arxiv_chunk_map (arxiv_code, version, child_id);
+            """
+            )
         )
+    return True
+
+
+## Chunk text is materialized from the paper's single text copy by its span.
+CHUNK_TEXT_SQL = "substr(t.text, p.start_idx + 1, p.end_idx - p.start_idx)"
+
+## Chunking version (see j0_doc_chunker) whose chunks are embedded in the collections.
+EMBEDDING_CHUNK_VERSION = "2000_200"
+## Parent chunk version used as RAG context unless another one is selected.
+DEFAULT_PARENT_CHUNK_VERSION = "10000_1000"
+
+
+def create_chunk_store_tables():
+    """Create the tables holding each paper's text once, its chunk spans and the
+    child-to-parent chunk map."""
+    with get_engine().begin() as conn:
+        conn.execute(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS arxiv_documents (
+                arxiv_code TEXT PRIMARY KEY,
+                text TEXT NOT NULL
+            );
+            """
+            )
+        )
+        conn.execute(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS arxiv_chunk_spans (
+                arxiv_code TEXT NOT NULL,
+                version TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                start_idx INTEGER NOT NULL,
+                end_idx INTEGER NOT NULL,
+                PRIMARY KEY (arxiv_code, version, chunk_id)
+            );
+            """
+            )
+        )
+        conn.execute(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS arxiv_chunk_map (
+                arxiv_code TEXT NOT NULL,
+                child_id INTEGER NOT NULL,
+                parent_id INTEGER NOT NULL,
+                version TEXT NOT NULL
+            );
+            """
+            )
+        )
+    return True
+
+
+def get_chunk_span_codes(version: str, table_name: str = "arxiv_chunk_spans"):
+    """Get the arxiv codes processed for a chunking version (spans or chunk map)."""
+    with get_engine().begin() as conn:
+        result = conn.execute(
+            text(
+                f"SELECT DISTINCT arxiv_code FROM {table_name} "
+                "WHERE version = :version"
+            ),
+            {"version": version},
+        )
+        return [row[0] for row in result.fetchall()]
+
+
+def get_parent_chunk_versions():
+    """Get the parent chunk versions with a child-to-parent mapping, default first."""
+    with get_engine().begin() as conn:
+        result = conn.execute(
+            text("SELECT DISTINCT version FROM arxiv_chunk_map ORDER BY version;")
+        )
+        versions = [row[0] for row in result.fetchall()]
+    if DEFAULT_PARENT_CHUNK_VERSION in versions:
+        versions.remove(DEFAULT_PARENT_CHUNK_VERSION)
+        versions.insert(0, DEFAULT_PARENT_CHUNK_VERSION)
+    return versions
+
+
+def get_arxiv_parent_chunks(chunk_ids: list, version=DEFAULT_PARENT_CHUNK_VERSION):
+    """Get parent chunks with metadata for a list of (arxiv_code, child_id) tuples."""
+    arxiv_codes = [arxiv_code for arxiv_code, _ in chunk_ids]
+    child_ids = [int(child_id) for _, child_id in chunk_ids]
+    with get_engine().begin() as conn:
         query = text(
             f"""
-            SELECT d.arxiv_code, d.published, s.citation_count, p.text
-            FROM {source_table} p , arxiv_details d, semantic_details s
-            WHERE p.arxiv_code = d.arxiv_code
-            AND p.arxiv_code = s.arxiv_code
-            AND ({conditions});
+            SELECT DISTINCT ON (p.arxiv_code, p.chunk_id)
+                   d.arxiv_code, d.published, s.citation_count,
+                   {CHUNK_TEXT_SQL} AS text
+            FROM unnest(CAST(:arxiv_codes AS text[]), CAST(:child_ids AS int[]))
+                AS c(arxiv_code, child_id)
+            JOIN arxiv_chunk_map m
+                ON m.arxiv_code = c.arxiv_code AND m.child_id = c.child_id
+                AND m.version = :version
+            JOIN arxiv_chunk_spans p
+                ON p.arxiv_code = m.arxiv_code AND p.chunk_id = m.parent_id
+                AND p.version = m.version
+            JOIN arxiv_documents t ON t.arxiv_code = p.arxiv_code
+            JOIN arxiv_details d ON p.arxiv_code = d.arxiv_code
+            JOIN semantic_details s ON p.arxiv_code = s.arxiv_code;
             """
         )
-        result = conn.execute(query)
-        chunks = result.fetchall()
-        chunks_df = pd.DataFrame(chunks)
+        result = conn.execute(
+            query,
+            {"arxiv_codes": arxiv_codes, "child_ids": child_ids, "version": version},
+        )
+        chunks_df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
     return chunks_df
 
 
+def get_chunk_texts(chunk_ids: list, version: str = EMBEDDING_CHUNK_VERSION):
+    """Get {(arxiv_code, chunk_id): text} of a list of (arxiv_code, chunk_id) tuples."""
+    arxiv_codes = [arxiv_code for arxiv_code, _ in chunk_ids]
+    int_ids = [int(chunk_id) for _, chunk_id in chunk_ids]
+    with get_engine().begin() as conn:
+        query = text(
+            f"""
+            SELECT p.arxiv_code, p.chunk_id, {CHUNK_TEXT_SQL} AS text
+            FROM unnest(CAST(:arxiv_codes AS text[]), CAST(:chunk_ids AS int[]))
+                AS c(arxiv_code, chunk_id)
+            JOIN arxiv_chunk_spans p
+                ON p.arxiv_code = c.arxiv_code AND p.chunk_id = c.chunk_id
+                AND p.version = :version
+            JOIN arxiv_documents t ON t.arxiv_code = p.arxiv_code;
+            """
+        )
+        result = conn.execute(
+            query,
+            {"arxiv_codes": arxiv_codes, "chunk_ids": int_ids, "version": version},
+        )
+        return {(row[0], row[1]): row[2] for row in result.fetchall()}
+
+
+def create_embedding_table(collection_name: str):
+    """Create the typed embedding table of a collection (one row per chunk). Chunk
+    text is not stored; it is sliced from `arxiv_documents` by its span."""
+    dim = COLLECTION_DIMS[collection_name]
+    with get_engine().begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
+        conn.execute(
+            text(
+                f"""
+            CREATE TABLE IF NOT EXISTS {collection_name} (
+                arxiv_code TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                embedding VECTOR({dim}) NOT NULL,
+                PRIMARY KEY (arxiv_code, chunk_id)
+            );
+            """
+            )
+        )
+        conn.execute(
+            text(f"ALTER TABLE {collection_name} DROP COLUMN IF EXISTS document;")
+        )
+    return True
+
+
+def create_embedding_index(
+    collection_name: str, method="hnsw", m=16, ef_construction=64, lists=100
+):
+    """(Re)build the cosine ANN index of a collection's embedding table."""
+    if method == "hnsw":
+        index_params = f"USING hnsw (embedding vector_cosine_ops) WITH (m = {int(m)}, ef_construction = {int(ef_construction)})"
+    elif method == "ivfflat":
+        index_params = f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {int(lists)})"
+    else:
+        raise ValueError(f"Unknown index method: {method}")
+    with get_engine().begin() as conn:
+        conn.execute(text(f"DROP INDEX IF EXISTS {collection_name}_embedding_idx;"))
+        conn.execute(
+            text(
+                f"CREATE INDEX {collection_name}_embedding_idx ON {collection_name} {index_params};"
+            )
+        )
+    return True
+
+
+def migrate_collection_embeddings(collection_name: str):
+    """Copy a LangChain PGVector collection into its typed embedding table."""
+    dim = COLLECTION_DIMS[collection_name]
+    with get_engine().begin() as conn:
+        result = conn.execute(
+            text(
+                f"""
+            INSERT INTO {collection_name} (arxiv_code, chunk_id, embedding)
+            SELECT e.cmetadata->>'arxiv_code', (e.cmetadata->>'chunk_id')::int,
+                   e.embedding::vector({dim})
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+            WHERE c.name = :collection_name
+            AND e.cmetadata->>'arxiv_code' IS NOT NULL
+            ON CONFLICT (arxiv_code, chunk_id) DO NOTHING;
+            """
+            ),
+            {"collection_name": collection_name},
+        )
+        return result.rowcount
+
+
+def bulk_insert_embeddings(collection_name: str, records: list):
+    """COPY (arxiv_code, chunk_id, embedding) records into a collection table,
+    skipping chunks that are already embedded."""
+    embeddings_df = pd.DataFrame(
+        [
+            (arxiv_code, int(chunk_id), str(list(map(float, embedding))))
+            for arxiv_code, chunk_id, embedding in records
+        ],
+        columns=["arxiv_code", "chunk_id", "embedding"],
+    )
+    return upload_df_to_db(
+        embeddings_df, collection_name, conflict_columns=["arxiv_code", "chunk_id"]
+    )
+
+
+def search_embeddings(collection_name: str, embedding: list, k: int = 20):
+    """Get (arxiv_code, chunk_id, text, cosine distance) of the k nearest chunks."""
+    with get_engine().begin() as conn:
+        result = conn.execute(
+            text(
+                f"""
+            SELECT e.arxiv_code, e.chunk_id, {CHUNK_TEXT_SQL} AS text, e.distance
+            FROM (
+                SELECT arxiv_code, chunk_id,
+                       embedding <=> CAST(:embedding AS vector) AS distance
+                FROM {collection_name}
+                ORDER BY embedding <=> CAST(:embedding AS vector)
+                LIMIT :k
+            ) e
+            JOIN arxiv_chunk_spans p
+                ON p.arxiv_code = e.arxiv_code AND p.chunk_id = e.chunk_id
+                AND p.version = :version
+            JOIN arxiv_documents t ON t.arxiv_code = p.arxiv_code
+            ORDER BY e.distance;
+            """
+            ),
+            {
+                "embedding": str(list(map(float, embedding))),
+                "k": k,
+                "version": EMBEDDING_CHUNK_VERSION,
+            },
+        )
+        return result.fetchall()
+
+
+def stream_collection_embeddings(collection_name: str, batch_size: int = 10000):
+    """Get (row count, iterator of (keys DF, embedding matrix) batches) of a collection
+    table. Rows are read from one snapshot through a server-side cursor, so only a
+    batch is held in memory at a time."""
+    conn = get_engine().connect().execution_options(isolation_level="REPEATABLE READ")
+    n_rows = conn.execute(text(f"SELECT COUNT(*) FROM {collection_name};")).scalar()
+    if n_rows == 0:
+        conn.close()
+        return 0, iter([])
+
+    def iter_batches():
+        try:
+            result = conn.execution_options(
+                stream_results=True, yield_per=batch_size
+            ).execute(
+                text(f"SELECT arxiv_code, chunk_id, embedding::real[] FROM {collection_name};")
+            )
+            for rows in result.partitions():
+                keys_df = pd.DataFrame(
+                    [(row[0], row[1]) for row in rows], columns=["arxiv_code", "chunk_id"]
+                )
+                yield keys_df, np.array([row[2] for row in rows], dtype=np.float32)
+        finally:
+            conn.close()
+
+    return n_rows, iter_batches()
+
+
+## Unique key of each table written through upsert (see `upload_to_db`).
+TABLE_UNIQUE_KEYS = {
+    "arxiv_details": ["arxiv_code"],
+    "semantic_details": ["arxiv_code"],
+}
+
+## Rows per multi-row INSERT statement.
+UPSERT_BATCH_SIZE = 500
+
+
+def create_unique_index(table_name: str, db_params: dict = db_params):
+    """Declare the unique key of a table (required by ON CONFLICT upserts). Run once
+    at the start of the stages that upsert; fails if the table has duplicate keys."""
+    key_columns = TABLE_UNIQUE_KEYS[table_name]
+    index_name = f"{table_name}_{'_'.join(key_columns)}_key"
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        result = conn.execute(
+            text("SELECT to_regclass(:index_name);"), {"index_name": index_name}
+        )
+        if result.fetchone()[0] is not None:
+            return True
+        result = conn.execute(
+            text(
+                f"""
+            SELECT {', '.join(key_columns)}, COUNT(*)
+            FROM {table_name}
+            GROUP BY {', '.join(key_columns)}
+            HAVING COUNT(*) > 1
+            LIMIT 5;
+            """
+            )
+        )
+        duplicates = result.fetchall()
+        if len(duplicates) > 0:
+            raise ValueError(
+                f"Cannot create unique index on {table_name} ({', '.join(key_columns)}): "
+                f"duplicate keys found, e.g. {[tuple(row[:-1]) for row in duplicates]}. "
+                "Remove the duplicate rows and re-run."
+            )
+        conn.execute(
+            text(
+                f"CREATE UNIQUE INDEX {index_name} ON {table_name} ({', '.join(key_columns)});"
+            )
+        )
+    return True
+
+
 def check_in_db(arxiv_code, db_params, table_name):
     """Check if an arxiv code is in the database."""
-    with psycopg2.connect(**db_params) as conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT * FROM {table_name} WHERE arxiv_code = '{arxiv_code}'")
-            return bool(cur.rowcount)
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        query = text(
+            f"SELECT 1 FROM {table_name} WHERE arxiv_code = :arxiv_code LIMIT 1"
+        )
+        result = conn.execute(query, {"arxiv_code": arxiv_code})
+        return result.fetchone() is not None
 
 
-def upload_to_db(data, db_params, table_name):
-    """Upload a dictionary to a database."""
-    with psycopg2.connect(**db_params) as conn:
-        with conn.cursor() as cur:
-            columns = ", ".join(data.keys())
-            placeholders = ", ".join(["%s"] * len(data))
-            cur.execute(
-                f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})",
-                list(data.values()),
-            )
+def upload_to_db(data, db_params, table_name, upsert=False):
+    """Upload a dictionary (or list of them) to a database. With `upsert`, rows
+    whose unique key (TABLE_UNIQUE_KEYS, see `create_unique_index`) already exists
+    are updated in place; only the columns present in a record are written."""
+    records = [data] if isinstance(data, dict) else list(data)
+    if len(records) == 0:
+        return 0
+    key_columns = []
+    if upsert:
+        key_columns = TABLE_UNIQUE_KEYS[table_name]
+        ## A row can only be upserted once per statement: merge duplicate keys.
+        merged = {}
+        for record in records:
+            key = tuple([record[c] for c in key_columns])
+            merged[key] = {**merged.get(key, {}), **record}
+        records = list(merged.values())
+
+    ## Records with the same columns share an INSERT (no NULL-filling).
+    column_groups = {}
+    for record in records:
+        column_groups.setdefault(tuple(record.keys()), []).append(record)
+
+    written = 0
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        for columns, group in column_groups.items():
+            on_conflict = ""
+            if upsert:
+                updates = [
+                    f"{c} = EXCLUDED.{c}" for c in columns if c not in key_columns
+                ]
+                on_conflict = f"ON CONFLICT ({', '.join(key_columns)}) DO "
+                on_conflict += (
+                    f"UPDATE SET {', '.join(updates)}" if updates else "NOTHING"
+                )
+            for batch_st in range(0, len(group), UPSERT_BATCH_SIZE):
+                batch = group[batch_st : batch_st + UPSERT_BATCH_SIZE]
+                values, params = [], {}
+                for i, record in enumerate(batch):
+                    values.append("(" + ", ".join([f":{c}_{i}" for c in columns]) + ")")
+                    params.update({f"{c}_{i}": record[c] for c in columns})
+                result = conn.execute(
+                    text(
+                        f"INSERT INTO {table_name} ({', '.join(columns)}) "
+                        f"VALUES {', '.join(values)} {on_conflict}"
+                    ),
+                    params,
+                )
+                written += result.rowcount
+    return written
 
 
 def remove_from_db(arxiv_code, db_params, table_name):
     """Remove an entry from the database."""
-    with psycopg2.connect(**db_params) as conn:
-        with conn.cursor() as cur:
-            cur.execute(f"DELETE FROM {table_name} WHERE arxiv_code = '{arxiv_code}'")
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"DELETE FROM {table_name} WHERE arxiv_code = :arxiv_code"),
+            {"arxiv_code": arxiv_code},
+        )
+
+
+def to_copy_format(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast float columns holding only whole numbers (ints upcast by missing
+    values) to nullable ints, so COPY into integer columns gets `12`, not `12.0`."""
+    df = df.copy()
+    for col in df.select_dtypes(include="float").columns:
+        values = df[col].dropna()
+        if len(values) > 0 and (values == values.round()).all():
+            df[col] = df[col].astype("Int64")
+    return df
 
 
 def upload_df_to_db(
-    df: pd.DataFrame, table_name: str, params: dict, if_exists: str = "append"
+    df: pd.DataFrame,
+    table_name: str,
+    params: dict = db_params,
+    if_exists: str = "append",
+    conflict_columns: list = None,
+    update: bool = False,
 ):
-    """Upload a dataframe to a database."""
-    db_url = (
-        f"postgresql+psycopg2://{params['user']}:{params['password']}"
-        f"@{params['host']}:{params['port']}/{params['dbname']}"
-    )
-    engine = create_engine(db_url)
-    df.to_sql(
-        table_name,
-        engine,
-        if_exists=if_exists,
-        index=False,
-        method="multi",
-        chunksize=10,
-    )
+    """Bulk upload a dataframe via COPY. Plain appends COPY straight into the table;
+    with `conflict_columns`, rows go through a staging table and those clashing on
+    the keys are skipped (or updated, with `update`). Missing tables are created from the DF schema; existing ones
+    are truncated (not dropped, as views may depend on them) with "replace".
+    Missing values are written as NULL; empty strings stay empty strings.
+    `if_exists` is "append", "replace" or "fail" (raise if the table exists).
+    Returns the number of rows written (0 for an empty DF)."""
+    if if_exists not in ["append", "replace", "fail"]:
+        raise ValueError(f"Invalid if_exists value: '{if_exists}'.")
+    if len(df) == 0:
+        return 0
+    st_time = time.perf_counter()
+    db_url = get_db_url(params)
+    engine = get_engine(db_url)
+    truncate = False
+    table_exists = (db_url, table_name) in _known_tables or inspect(
+        engine
+    ).has_table(table_name)
+    if table_exists and if_exists == "fail":
+        raise ValueError(f"Table '{table_name}' already exists.")
+    if not table_exists:
+        with engine.begin() as conn:
+            df.head(0).to_sql(table_name, conn, index=False)
+    elif if_exists == "replace":
+        truncate = True
+    _known_tables.add((db_url, table_name))
+
+    buffer = io.StringIO()
+    to_copy_format(df).to_csv(buffer, index=False, header=False, na_rep="\\N")
+    buffer.seek(0)
+    columns = ", ".join([f'"{c}"' for c in df.columns])
+    on_conflict = ""
+    if conflict_columns:
+        conflict_target = ", ".join([f'"{c}"' for c in conflict_columns])
+        updates = [
+            f'"{c}" = EXCLUDED."{c}"' for c in df.columns if c not in conflict_columns
+        ]
+        if update and len(updates) > 0:
+            on_conflict = f"ON CONFLICT ({conflict_target}) DO UPDATE SET "
+            on_conflict += ", ".join(updates)
+        else:
+            on_conflict = f"ON CONFLICT ({conflict_target}) DO NOTHING"
 
-    ## Commit.
-    with psycopg2.connect(**params) as conn:
+    conn = engine.raw_connection()
+    try:
         with conn.cursor() as cur:
-            cur.execute("COMMIT")
+            if truncate:
+                cur.execute(f"TRUNCATE {table_name};")
+            if not on_conflict:
+                cur.copy_expert(
+                    f"COPY {table_name} ({columns}) "
+                    "FROM STDIN WITH (FORMAT csv, NULL '\\N');",
+                    buffer,
+                )
+                written = len(df)
+            else:
+                cur.execute(
+                    f"""
+                    CREATE TEMP TABLE {table_name}_staging
+                    (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP;
+                    """
+                )
+                cur.copy_expert(
+                    f"COPY {table_name}_staging ({columns}) "
+                    "FROM STDIN WITH (FORMAT csv, NULL '\\N');",
+                    buffer,
+                )
+                cur.execute(
+                    f"""
+                    INSERT INTO {table_name} ({columns})
+                    SELECT {columns} FROM {table_name}_staging
+                    {on_conflict};
+                    """
+                )
+                written = cur.rowcount
+        conn.commit()
+    finally:
+        conn.close()
 
-    ## Close.
-    engine.dispose()
+    with _upload_stats_lock:
+        stats = _upload_stats.setdefault(table_name, {"rows": 0, "seconds": 0.0})
+        stats["rows"] += written
+        stats["seconds"] += time.perf_counter() - st_time
+    return written
 
-    return True
+
+def get_upload_stats() -> dict:
+    """Rows written and rows/sec of bulk uploads in this process, per table."""
+    with _upload_stats_lock:
+        return {
+            table_name: {
+                **stats,
+                "rows_per_sec": stats["rows"] / max(stats["seconds"], 1e-9),
+            }
+            for table_name, stats in _upload_stats.items()
+        }
 
 
 def get_arxiv_id_list(db_params, table_name):
     """Get a list of all arxiv codes in the database."""
-    with psycopg2.connect(**db_params) as conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT DISTINCT arxiv_code FROM {table_name}")
-            return [row[0] for row in cur.fetchall()]
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        result = conn.execute(text(f"SELECT DISTINCT arxiv_code FROM {table_name}"))
+        return [row[0] for row in result.fetchall()]
 
 
 def get_max_table_date(db_params, table_name, date_col="date"):
     """Get the max date in a table."""
-    with psycopg2.connect(**db_params) as conn:
-        with conn.cursor() as cur:
-            cur.execute(f"SELECT MAX({date_col}) FROM {table_name}")
-            return cur.fetchone()[0]
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        result = conn.execute(text(f"SELECT MAX({date_col}) FROM {table_name}"))
+        return result.fetchone()[0]
 
 
-def get_arxiv_id_embeddings(db_params, collection_name):
-    with psycopg2.connect(**db_params) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+## Days over which citation velocity (citations gained) is measured.
+CITATION_VELOCITY_DAYS = 30
+
+
+def create_citation_history():
+    """Create the citation time-series (one row per observed change), seed it
+    with current counts and create the `citation_latest` view joined into `papers`."""
+    with get_engine().begin() as conn:
+        conn.execute(
+            text("ALTER TABLE semantic_details ADD COLUMN IF NOT EXISTS tstp TIMESTAMP")
+        )
+        conn.execute(
+            text(
+                """
+            CREATE TABLE IF NOT EXISTS citation_history (
+                arxiv_code TEXT NOT NULL,
+                tstp TIMESTAMP NOT NULL,
+                citation_count INTEGER,
+                influential_citation_count INTEGER,
+                PRIMARY KEY (arxiv_code, tstp)
+            );
+            """
+            )
+        )
+        conn.execute(
+            text(
+                """
+            INSERT INTO citation_history
+            SELECT sd.arxiv_code, COALESCE(sd.tstp, now()),
+                   sd.citation_count, sd.influential_citation_count
+            FROM semantic_details sd
+            WHERE sd.citation_count IS NOT NULL
+            AND NOT EXISTS (
+                SELECT 1 FROM citation_history h WHERE h.arxiv_code = sd.arxiv_code
+            );
+            """
+            )
+        )
+        conn.execute(
+            text(
                 f"""
-                SELECT DISTINCT a.cmetadata->>'arxiv_code' AS arxiv_code
-                FROM langchain_pg_embedding a, langchain_pg_collection b
-                WHERE a.collection_id = b.uuid
-                AND b.name = '{collection_name}'
-                AND a.cmetadata->>'arxiv_code' IS NOT NULL;"""
+            CREATE OR REPLACE VIEW citation_latest AS
+            SELECT l.arxiv_code, l.tstp, l.citation_count, l.influential_citation_count,
+                   l.citation_count - COALESCE(b.citation_count, f.citation_count)
+                       AS citation_velocity
+            FROM (
+                SELECT DISTINCT ON (arxiv_code) *
+                FROM citation_history
+                ORDER BY arxiv_code, tstp DESC
+            ) l
+            LEFT JOIN LATERAL (
+                SELECT h.citation_count FROM citation_history h
+                WHERE h.arxiv_code = l.arxiv_code
+                AND h.tstp <= now() - INTERVAL '{CITATION_VELOCITY_DAYS} days'
+                ORDER BY h.tstp DESC LIMIT 1
+            ) b ON TRUE
+            LEFT JOIN LATERAL (
+                SELECT h.citation_count FROM citation_history h
+                WHERE h.arxiv_code = l.arxiv_code
+                ORDER BY h.tstp ASC LIMIT 1
+            ) f ON TRUE;
+            """
+            )
+        )
+    return True
+
+
+def get_citation_snapshot(db_params=db_params):
+    """Get the last fetch time (None if unknown) and counts of each paper."""
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(
+                """
+            SELECT arxiv_code, tstp, citation_count, influential_citation_count
+            FROM semantic_details
+            """
             )
-            return [row[0] for row in cur.fetchall()]
+        )
+        return {
+            row[0]: {
+                "tstp": row[1],
+                "citation_count": row[2],
+                "influential_citation_count": row[3],
+            }
+            for row in result.fetchall()
+        }
+
+
+def touch_citation_fetch(arxiv_codes: list, tstp, db_params=db_params):
+    """Mark papers whose citation counts did not change as fetched at `tstp`."""
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "UPDATE semantic_details SET tstp = :tstp "
+                "WHERE arxiv_code = ANY(:arxiv_codes)"
+            ),
+            {"tstp": tstp, "arxiv_codes": list(arxiv_codes)},
+        )
+    return True
+
+
+def get_arxiv_id_embeddings(db_params, collection_name):
+    """Get a list of all arxiv codes embedded in a collection."""
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        result = conn.execute(text(f"SELECT DISTINCT arxiv_code FROM {collection_name};"))
+        return [row[0] for row in result.fetchall()]
 
 
 def get_arxiv_title_dict(db_params=db_params):
     """Get a list of all arxiv titles in the database."""
-    with psycopg2.connect(**db_params) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(
                 f"""
             SELECT a.arxiv_code, a.title 
             FROM arxiv_details a
             WHERE a.title IS NOT NULL
             """
             )
-            title_map = {row[0]: row[1] for row in cur.fetchall()}
-            return title_map
+        )
+        title_map = {row[0]: row[1] for row in result.fetchall()}
+        return title_map
 
 
 def get_topic_embedding_dist(db_params=db_params):
     """Get mean and stdDev for topic embeddings (dim1 & dim2)."""
-    with psycopg2.connect(**db_params) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    engine = get_engine(get_db_url(db_params))
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(
                 """
             SELECT AVG(dim1), STDDEV(dim1), AVG(dim2), STDDEV(dim2)
             FROM topics
             """
             )
-            res = cur.fetchone()
-            res = {
-                "dim1": {"mean": res[0], "std": res[1]},
-                "dim2": {"mean": res[2], "std": res[3]},
-            }
-            return res
+        )
+        res = result.fetchone()
+        res = {
+            "dim1": {"mean": res[0], "std": res[1]},
+            "dim2": {"mean": res[2], "std": res[3]},
+        }
+        return res
 
 
 def get_weekly_summary_inputs(date: str):
     """Get weekly summaries for a given date (from last monday to next sunday)."""
-    engine = create_engine(database_url)
+    engine = get_engine()
     ## Find last monday if not monday.
     date_st = pd.to_datetime(date).date() - pd.Timedelta(
         days=pd.to_datetime(date).weekday()
@@ -354,7 +1328,7 @@ def get_weekly_summary_inputs(date: str):
 
 def check_weekly_summary_exists(date_str: str):
     """Check if weekly summary exists for a given date."""
-    engine = create_engine(database_url)
+    engine = get_engine()
     with engine.begin() as conn:
         query = text(
             f"""
@@ -366,13 +1340,12 @@ def check_weekly_summary_exists(date_str: str):
         result = conn.execute(query)
         count = result.fetchone()[0]
 
-    engine.dispose()
     return count > 0
 
 
 def get_weekly_summary(date_str: str):
     """Get weekly summary for a given date."""
-    engine = create_engine(database_url)
+    engine = get_engine()
     date_str = (
         pd.to_datetime(date_str).date()
         - pd.Timedelta(days=pd.to_datetime(date_str).weekday())
@@ -388,13 +1361,12 @@ def get_weekly_summary(date_str: str):
         result = conn.execute(query)
         review = result.fetchone()[0]
 
-    engine.dispose()
     return review
 
 
 def get_extended_notes(arxiv_code: str, level=None, expected_tokens=None):
     """Get extended summary for a given arxiv code."""
-    engine = create_engine(database_url)
+    engine = get_engine()
     with engine.begin() as conn:
         if level:
             query = text(
@@ -425,5 +1397,4 @@ def get_extended_notes(arxiv_code: str, level=None, expected_tokens=None):
             )
         result = conn.execute(query)
         summary = result.fetchone()
-    engine.dispose()
     return summary[2]
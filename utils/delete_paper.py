@@ -3,34 +3,37 @@ import os, sys
 import json
 import pandas as pd
 from dotenv import load_dotenv
-import psycopg2
+from sqlalchemy import text
 
 load_dotenv()
 sys.path.append(os.environ.get("PROJECT_PATH"))
 os.chdir(os.environ.get("PROJECT_PATH"))
 
 import utils.db as db
+import utils.chunk_store as cs
 
 def delete_from_db(arxiv_code: str):
-    with psycopg2.connect(**db.db_params) as conn:
-        with conn.cursor() as cur:
-            table_names = [
-                "arxiv_details",
-                "summaries",
-                "summary_notes",
-                "recursive_summaries",
-                "semantic_details",
-                "topics",
-                "arxiv_chunks",
-                "arxiv_parent_chunks",
-                "arxiv_large_parent_chunks",
-                "arxiv_qna",
-            ]
-            for table_name in table_names:
-                cur.execute(
-                    f"DELETE FROM {table_name} WHERE arxiv_code = %s", (arxiv_code,)
-                )
-                print(f"Deleted {arxiv_code} from {table_name}.")
+    with db.get_engine().begin() as conn:
+        table_names = [
+            "arxiv_details",
+            "summaries",
+            "summary_notes",
+            "recursive_summaries",
+            "semantic_details",
+            "topics",
+            "arxiv_documents",
+            "arxiv_chunk_spans",
+            "arxiv_chunk_map",
+            "arxiv_qna",
+            "arxiv_vectors",
+            "arxiv_vectors_cv3",
+        ]
+        for table_name in table_names:
+            conn.execute(
+                text(f"DELETE FROM {table_name} WHERE arxiv_code = :arxiv_code"),
+                {"arxiv_code": arxiv_code},
+            )
+            print(f"Deleted {arxiv_code} from {table_name}.")
 
 
 def delete_paper(arxiv_code: str):
@@ -102,6 +105,10 @@ def delete_paper(arxiv_code: str):
         os.remove(arxiv_large_chunks_file)
         print(f"Deleted {arxiv_large_chunks_file}.")
 
+    ## Arxiv chunk spans.
+    for spans_file in cs.delete_spans(arxiv_code):
+        print(f"Deleted {spans_file}.")
+
     ## Arxiv QnA.
     qna_file = f"data/arxiv_qna/{arxiv_code}.json"
     if os.path.exists(qna_file):
@@ -2,6 +2,7 @@ import os
 import re, json
 import arxiv
 import requests
+from urllib3.util.retry import Retry
 import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
@@ -279,6 +280,15 @@ def transform_flat_dict(flat_data, mapping):
 #################
 ## ARXIV TOOLS ##
 #################
+## Codes per id_list query; arXiv asks for >= 3 seconds between API calls.
+ARXIV_BATCH_SIZE = 100
+ARXIV_DELAY_SECONDS = 3
+ARXIV_API_HOST = "export.arxiv.org"
+arxiv_client = arxiv.Client(
+    page_size=ARXIV_BATCH_SIZE, delay_seconds=ARXIV_DELAY_SECONDS, num_retries=3
+)
+
+
 def search_arxiv_doc(paper_name):
     """Search for a paper in Arxiv and return the most similar one."""
     is_code = is_arxiv_code(paper_name)
@@ -321,6 +331,38 @@ def search_arxiv_doc(paper_name):
     return docs[0]
 
 
+def search_arxiv_result(paper_name, limiter=None):
+    """Search for a paper in Arxiv (meta-data only) and return the most similar
+    result, with the same matching rules as `search_arxiv_doc`."""
+    if limiter:
+        limiter.acquire(ARXIV_API_HOST)
+    if is_arxiv_code(paper_name):
+        results = list(arxiv_client.results(arxiv.Search(id_list=[paper_name])))
+        if len(results) == 0 or paper_name not in results[0].entry_id:
+            return None
+        return results[0]
+
+    paper_name = preprocess(paper_name)
+    results = list(arxiv_client.results(arxiv.Search(query=paper_name, max_results=3)))
+    if len(results) == 0:
+        return None
+    results = sorted(
+        results, key=lambda x: tfidf_similarity(paper_name, x.title), reverse=True
+    )
+    if tfidf_similarity(paper_name, results[0].title) < 0.9:
+        return None
+    return results[0]
+
+
+def extract_pdf_text(pdf_content: bytes, max_chars=1000000):
+    """Extract the text of a PDF (as `ArxivLoader` does)."""
+    import fitz
+
+    with fitz.open(stream=pdf_content, filetype="pdf") as doc:
+        text = "".join(page.get_text() for page in doc)
+    return text[:max_chars]
+
+
 def preprocess_arxiv_doc(doc_content, token_encoder=None, max_tokens=None, remove_references=True):
     """Preprocess an Arxiv document."""
     doc_content = reformat_text(doc_content)
@@ -361,6 +403,16 @@ def get_arxiv_info(arxiv_code: str, title: Optional[str] = None):
     return arxiv_meta
 
 
+def get_arxiv_info_batch(arxiv_codes: list):
+    """Retrieve Arxiv meta-data for many codes with a single id_list query.
+    Returns a dict keyed by Arxiv code (codes not found are left out)."""
+    search = arxiv.Search(id_list=list(arxiv_codes), max_results=len(arxiv_codes))
+    arxiv_meta = {}
+    for res in arxiv_client.results(search):
+        arxiv_meta[res.get_short_id().split("v")[0]] = res
+    return arxiv_meta
+
+
 def process_arxiv_data(data):
     """Transform the arxiv data for database insertion."""
     data = {k.lower(): v for k, v in data.items()}
@@ -388,9 +440,52 @@ def process_arxiv_data(data):
     return filtered_data
 
 
+SEMANTIC_SCHOLAR_URL = "https://api.semanticscholar.org/graph/v1/paper"
+SEMANTIC_SCHOLAR_FIELDS = "title,citationCount,influentialCitationCount,tldr,venue"
+## Max. IDs per request accepted by the batch endpoint.
+SEMANTIC_SCHOLAR_BATCH_SIZE = 500
+
+
+def get_http_session(pool_size=10):
+    """Requests session with a connection pool sized for concurrent workers,
+    retrying idempotent requests on connection errors, 429 and 5xx."""
+    session = requests.Session()
+    retries = Retry(
+        total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504]
+    )
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_semantic_scholar_info_batch(arxiv_codes, session=None):
+    """Retrieve Semantic Scholar meta-data for many Arxiv codes in one request.
+    Returns a dict keyed by Arxiv code (codes not found are left out)."""
+    session = requests if session is None else session
+    headers = {}
+    if os.getenv("SEMANTIC_SCHOLAR_API_KEY"):
+        headers["x-api-key"] = os.getenv("SEMANTIC_SCHOLAR_API_KEY")
+    response = session.post(
+        f"{SEMANTIC_SCHOLAR_URL}/batch",
+        params={"fields": SEMANTIC_SCHOLAR_FIELDS},
+        json={"ids": [f"ARXIV:{arxiv_code}" for arxiv_code in arxiv_codes]},
+        headers=headers,
+        timeout=60,
+    )
+    response.raise_for_status()
+    return {
+        arxiv_code: info
+        for arxiv_code, info in zip(arxiv_codes, response.json())
+        if info is not None
+    }
+
+
 def get_semantic_scholar_info(arxiv_code):
     """Search article in Semantic Scholar by Arxiv code and retrieve meta-data."""
-    url = f"https://api.semanticscholar.org/graph/v1/paper/ARXIV:{arxiv_code}?fields=title,citationCount,influentialCitationCount,tldr,venue"
+    url = f"{SEMANTIC_SCHOLAR_URL}/ARXIV:{arxiv_code}?fields={SEMANTIC_SCHOLAR_FIELDS}"
     response = requests.get(url)
     if response.status_code == 200:
         return response.json()
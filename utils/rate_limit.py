@@ -0,0 +1,127 @@
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+import threading
+import random
+import time
+
+import requests
+
+RETRYABLE_EXCEPTIONS = (
+    ConnectionError,
+    TimeoutError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1):
+        """Block until `amount` tokens are available, then consume them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.last_refill) * self.rate
+                )
+                self.last_refill = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Per-provider budget on requests and (optionally) tokens per minute."""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ):
+        self.request_bucket = None
+        self.token_bucket = None
+        if requests_per_minute:
+            self.request_bucket = TokenBucket(
+                requests_per_minute / 60, requests_per_minute
+            )
+        if tokens_per_minute:
+            self.token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+
+    def acquire(self, tokens: float = 0):
+        """Wait for budget to issue one request consuming `tokens` tokens."""
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket and tokens:
+            self.token_bucket.acquire(tokens)
+
+
+class HostRateLimiter:
+    """Per-host politeness: a minimum interval between requests to each host,
+    shared by all threads (different hosts do not wait on each other)."""
+
+    def __init__(self, intervals: Dict[str, float], default_interval: float = 1):
+        self.intervals = intervals
+        self.default_interval = default_interval
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url: str):
+        """Wait until a request to the host of `url` (or a bare host) is allowed."""
+        host = urlparse(url).netloc or url
+        with self.lock:
+            if host not in self.buckets:
+                interval = self.intervals.get(host, self.default_interval)
+                self.buckets[host] = TokenBucket(1 / interval, 1)
+            bucket = self.buckets[host]
+        bucket.acquire(1)
+
+
+def get_status_code(exception: Exception) -> Optional[int]:
+    """Extract an HTTP status code from an API client exception, if any."""
+    for attr in ["http_status", "status_code", "status"]:
+        status = getattr(exception, attr, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(exception, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exception: Exception) -> bool:
+    """Rate limit (429), server (5xx) and connection errors are worth retrying."""
+    status = get_status_code(exception)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exception, RETRYABLE_EXCEPTIONS)
+
+
+def retry_with_backoff(
+    fn: Callable,
+    max_retries: int = 5,
+    base_delay: float = 1,
+    max_delay: float = 60,
+    limiter: Optional[RateLimiter] = None,
+    tokens: float = 0,
+):
+    """Call `fn`, retrying retryable errors with exponential backoff and jitter."""
+    for attempt in range(max_retries):
+        if limiter:
+            limiter.acquire(tokens)
+        try:
+            return fn()
+        except Exception as e:
+            if not is_retryable(e) or attempt == max_retries - 1:
+                raise
+            delay = min(max_delay, base_delay * 2**attempt)
+            time.sleep(delay * (0.5 + random.random() / 2))
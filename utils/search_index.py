@@ -0,0 +1,80 @@
+from collections import defaultdict
+from typing import Dict, List, Tuple
+import bisect
+import re
+
+import pandas as pd
+
+## Relative importance of a match on each searchable field.
+FIELD_WEIGHTS = {
+    "arxiv_code": 5.0,
+    "title": 3.0,
+    "authors": 2.0,
+    "contribution_title": 2.0,
+    "takeaway_title": 2.0,
+    "summary": 1.0,
+    "contribution_content": 1.0,
+    "takeaway_content": 1.0,
+}
+
+## Score multiplier for a query token matching only as a prefix of an indexed term.
+PREFIX_PENALTY = 0.5
+
+TOKEN_PATTERN = re.compile(r"\d{4}\.\d{4,5}|[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split a text blob into search tokens."""
+    if not isinstance(text, str):
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class PaperSearchIndex:
+    """In-memory inverted index over paper text fields with prefix matching."""
+
+    def __init__(self, field_weights: Dict[str, float] = FIELD_WEIGHTS):
+        self.field_weights = field_weights
+        self.postings = defaultdict(lambda: defaultdict(float))
+        self.vocabulary = []
+
+    def build(self, df: pd.DataFrame):
+        """Index the weighted text fields of a DF indexed by arxiv_code."""
+        for arxiv_code, row in df.iterrows():
+            for field, weight in self.field_weights.items():
+                value = arxiv_code if field == "arxiv_code" else row.get(field)
+                for token in tokenize(value):
+                    self.postings[token][arxiv_code] += weight
+        self.postings = {k: dict(v) for k, v in self.postings.items()}
+        self.vocabulary = sorted(self.postings.keys())
+        return self
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        """Indexed terms matching a query token, exactly or by prefix."""
+        matches = []
+        idx = bisect.bisect_left(self.vocabulary, token)
+        while idx < len(self.vocabulary) and self.vocabulary[idx].startswith(token):
+            term = self.vocabulary[idx]
+            matches.append((term, 1.0 if term == token else PREFIX_PENALTY))
+            idx += 1
+        return matches
+
+    def search(self, query: str) -> List[Tuple[str, float]]:
+        """Return (arxiv_code, score) pairs matching all query tokens, best first."""
+        scores = None
+        for token in set(tokenize(query)):
+            token_scores = defaultdict(float)
+            for term, factor in self._expand(token):
+                for arxiv_code, weight in self.postings[term].items():
+                    token_scores[arxiv_code] += weight * factor
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    k: v + token_scores[k] for k, v in scores.items() if k in token_scores
+                }
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)
@@ -0,0 +1,175 @@
+from typing import Iterable, List, Tuple
+import pandas as pd
+import numpy as np
+import json
+import os
+
+INDEX_PATH = os.path.join(os.environ.get("PROJECT_PATH", "."), "data", "vector_index")
+
+## Search local (memory-mapped) vector indexes instead of pgvector when available.
+USE_LOCAL_INDEX = os.getenv("USE_LOCAL_VECTOR_INDEX", "false").lower() == "true"
+
+## Rows scored per matmul block (bounds the float32 working set for float16 indexes).
+BATCH_ROWS = 65536
+
+## Max. rows sampled to fit the IVF centroids.
+IVF_TRAIN_ROWS = 100000
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of a matrix, so dot products are cosine similarities."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first."""
+    k = min(k, len(scores))
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+def train_ivf(vectors: np.ndarray, n_lists: int, n_iter: int = 20, seed: int = 42):
+    """Fit k-means centroids (spherical) and return (centroids, row assignments)."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = vectors[assignments == i]
+            if len(members) > 0:
+                centroids[i] = members.mean(axis=0)
+        centroids = normalize_rows(centroids)
+    assignments = np.argmax(vectors @ centroids.T, axis=1)
+    return centroids, assignments
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest-centroid IVF list of every row, computed in blocks."""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for block_st in range(0, len(vectors), BATCH_ROWS):
+        block = np.asarray(vectors[block_st : block_st + BATCH_ROWS], dtype=np.float32)
+        assignments[block_st : block_st + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def build_index(
+    collection_name: str,
+    batches: Iterable[Tuple[pd.DataFrame, np.ndarray]],
+    n_rows: int,
+    dim: int,
+    dtype: str = "float16",
+    n_lists: int = 0,
+):
+    """Stream (keys DF, embeddings) batches into a normalized on-disk matrix, with
+    optional IVF lists. Rows are stored grouped by IVF list so each list is a
+    contiguous slice. Only (arxiv_code, chunk_id) keys are kept; chunk text is
+    read from the chunk store on demand."""
+    index_dir = os.path.join(INDEX_PATH, collection_name)
+    os.makedirs(index_dir, exist_ok=True)
+    vectors_file = os.path.join(index_dir, "vectors.npy")
+    vectors = np.lib.format.open_memmap(
+        vectors_file, mode="w+", dtype=dtype, shape=(n_rows, dim)
+    )
+    keys, row = [], 0
+    for keys_df, embeddings in batches:
+        n = min(len(embeddings), n_rows - row)
+        vectors[row : row + n] = normalize_rows(np.asarray(embeddings[:n], dtype=np.float32))
+        keys.append(keys_df.iloc[:n])
+        row += n
+    metadata_df = pd.concat(keys, ignore_index=True)
+
+    list_offsets = None
+    if n_lists > 0:
+        rng = np.random.default_rng(42)
+        sample = rng.choice(n_rows, min(n_rows, IVF_TRAIN_ROWS), replace=False)
+        centroids, _ = train_ivf(
+            np.asarray(vectors[np.sort(sample)], dtype=np.float32), n_lists
+        )
+        assignments = assign_lists(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        sorted_file = os.path.join(index_dir, "vectors.sorted.npy")
+        sorted_vectors = np.lib.format.open_memmap(
+            sorted_file, mode="w+", dtype=dtype, shape=(n_rows, dim)
+        )
+        for block_st in range(0, n_rows, BATCH_ROWS):
+            block_rows = order[block_st : block_st + BATCH_ROWS]
+            sorted_vectors[block_st : block_st + len(block_rows)] = vectors[block_rows]
+        sorted_vectors.flush()
+        del vectors, sorted_vectors
+        os.replace(sorted_file, vectors_file)
+        metadata_df = metadata_df.iloc[order].reset_index(drop=True)
+        list_offsets = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+        np.save(os.path.join(index_dir, "centroids.npy"), centroids)
+        np.save(os.path.join(index_dir, "list_offsets.npy"), list_offsets)
+    else:
+        vectors.flush()
+        del vectors
+
+    metadata_df.to_pickle(os.path.join(index_dir, "metadata.pkl"))
+    with open(os.path.join(index_dir, "info.json"), "w") as f:
+        json.dump(
+            {"rows": n_rows, "dim": dim, "dtype": dtype, "n_lists": n_lists},
+            f,
+        )
+    return index_dir
+
+
+def index_exists(collection_name: str) -> bool:
+    """Check if a local index has been built for a collection."""
+    return os.path.exists(os.path.join(INDEX_PATH, collection_name, "info.json"))
+
+
+class LocalVectorIndex:
+    """Memory-mapped embedding matrix with exact (batched) or IVF top-k search."""
+
+    def __init__(self, collection_name: str):
+        index_dir = os.path.join(INDEX_PATH, collection_name)
+        with open(os.path.join(index_dir, "info.json")) as f:
+            self.info = json.load(f)
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        self.metadata = pd.read_pickle(os.path.join(index_dir, "metadata.pkl"))
+        self.centroids = None
+        self.list_offsets = None
+        if self.info["n_lists"] > 0:
+            self.centroids = np.load(os.path.join(index_dir, "centroids.npy"))
+            self.list_offsets = np.load(os.path.join(index_dir, "list_offsets.npy"))
+
+    def _search_rows(self, query: np.ndarray, start: int, end: int, k: int):
+        """Exact top-k over a contiguous row range, scored in blocks."""
+        best_idx = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for block_st in range(start, end, BATCH_ROWS):
+            block_end = min(block_st + BATCH_ROWS, end)
+            block = np.asarray(self.vectors[block_st:block_end], dtype=np.float32)
+            scores = block @ query
+            idx = top_k(scores, k)
+            best_idx = np.concatenate([best_idx, idx + block_st])
+            best_scores = np.concatenate([best_scores, scores[idx]])
+        return best_idx, best_scores
+
+    def search(self, query, k: int = 20, n_probe: int = None) -> List[Tuple[int, float]]:
+        """Return (row, cosine similarity) of the k nearest rows, best first.
+        With an IVF index and `n_probe` set, only the closest lists are scanned."""
+        query = normalize_rows(np.asarray(query, dtype=np.float32)[None, :])[0]
+        if self.centroids is not None and n_probe:
+            ranges = [
+                (self.list_offsets[i], self.list_offsets[i + 1])
+                for i in top_k(self.centroids @ query, n_probe)
+            ]
+        else:
+            ranges = [(0, len(self.vectors))]
+
+        all_idx, all_scores = [], []
+        for start, end in ranges:
+            if end > start:
+                idx, scores = self._search_rows(query, start, end, k)
+                all_idx.append(idx)
+                all_scores.append(scores)
+        if len(all_idx) == 0:
+            return []
+        all_idx = np.concatenate(all_idx)
+        all_scores = np.concatenate(all_scores)
+        order = top_k(all_scores, k)
+        return [(int(all_idx[i]), float(all_scores[i])) for i in order]
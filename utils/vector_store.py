@@ -1,4 +1,7 @@
 import pandas as pd
+import numpy as np
+import asyncio
+import time
 import os
 import demjson3
 
@@ -9,7 +12,12 @@ from langchain.chains import LLMChain
 from langchain.retrievers import ContextualCompressionRetriever
 from langchain.retrievers.document_compressors import CohereRerank
 from langchain.llms.together import Together
-from utils.custom_langchain import NewCohereEmbeddings, NewPGVector
+from utils.custom_langchain import (
+    NewCohereEmbeddings,
+    CachedQueryEmbeddings,
+    LocalVectorStore,
+    TypedPGVectorStore,
+)
 from langchain.chains.openai_functions import (
     create_structured_output_chain,
 )
@@ -19,11 +27,9 @@ import utils.custom_langchain as clc
 import utils.db as db
 import utils.prompts as ps
 import utils.app_utils as au
+import utils.vector_index as vi
 
-CONNECTION_STRING = (
-    f"postgresql+psycopg2://{db.db_params['user']}:{db.db_params['password']}"
-    f"@{db.db_params['host']}:{db.db_params['port']}/{db.db_params['dbname']}"
-)
+CONNECTION_STRING = db.database_url
 
 token_encoder = tiktoken.encoding_for_model("gpt-3.5-turbo")
 
@@ -48,6 +54,20 @@ llm_map = {
 }
 
 
+## Min. cosine similarity between questions to reuse a logged answer.
+ANSWER_CACHE_THRESHOLD = 0.95
+
+## IVF lists probed per local search (None = exact search).
+LOCAL_INDEX_N_PROBE = None
+
+## Rank offset for reciprocal rank fusion of multi-collection results.
+RRF_K = 60
+
+## Process-wide registries of RAG components (built once, reused across questions).
+_retrievers = {}
+_rag_chains = {}
+
+
 def validate_openai_env():
     """ Validate that the API base is not set to local."""
     api_base = os.environ.get("OPENAI_API_BASE", "")
@@ -57,21 +77,30 @@ def validate_openai_env():
 def initialize_retriever(collection_name):
     """Initialize retriever for GPT maestro."""
     if collection_name == "arxiv_vectors_cv3":
+        model_name = "embed-english-v3.0"
         embeddings = NewCohereEmbeddings(
-            cohere_api_key=os.getenv("COHERE_API_KEY"), model="embed-english-v3.0"
+            cohere_api_key=os.getenv("COHERE_API_KEY"), model=model_name
         )
     elif collection_name == "arxiv_vectors":
+        model_name = "thenlper/gte-large"
         embeddings = HuggingFaceInferenceAPIEmbeddings(
-            api_key=os.getenv("HUGGINGFACE_API_KEY"), model_name="thenlper/gte-large"
+            api_key=os.getenv("HUGGINGFACE_API_KEY"), model_name=model_name
         )
     else:
         raise ValueError(f"Unknown collection name: {collection_name}")
+    embeddings = CachedQueryEmbeddings(embeddings, model_name=model_name)
 
-    store = NewPGVector(
-        collection_name=collection_name,
-        connection_string=CONNECTION_STRING,
-        embedding_function=embeddings,
-    )
+    if vi.USE_LOCAL_INDEX and vi.index_exists(collection_name):
+        store = LocalVectorStore(
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            n_probe=LOCAL_INDEX_N_PROBE,
+        )
+    else:
+        store = TypedPGVectorStore(
+            collection_name=collection_name,
+            embedding_function=embeddings,
+        )
     retriever = store.as_retriever(search_type="similarity", search_kwargs={"k": 20})
 
     compressor = CohereRerank(
@@ -83,6 +112,90 @@ def initialize_retriever(collection_name):
     return compression_retriever
 
 
+def get_retriever(collection_name):
+    """Get the cached retriever for a collection, initializing it on first use."""
+    if collection_name not in _retrievers:
+        _retrievers[collection_name] = initialize_retriever(collection_name)
+    return _retrievers[collection_name]
+
+
+def get_query_cache_stats():
+    """Query embedding cache counters summed over the initialized retrievers."""
+    totals = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+    for retriever in _retrievers.values():
+        stats = retriever.base_retriever.vectorstore.embedding_function.cache_stats()
+        for key in totals:
+            totals[key] += stats[key]
+    return totals
+
+
+def get_rag_chain(model="GPT-3.5-Turbo"):
+    """Get the cached RAG LLMChain for a model, building it on first use."""
+    if model not in _rag_chains:
+        rag_prompt_custom = ChatPromptTemplate.from_messages(
+            [
+                ("system", ps.VS_SYSYEM_TEMPLATE),
+                ("human", "{question}"),
+            ]
+        )
+        _rag_chains[model] = LLMChain(
+            llm=llm_map[model], prompt=rag_prompt_custom, verbose=False
+        )
+    return _rag_chains[model]
+
+
+def embed_cache_question(
+    question: str, collection_name, chunk_version=db.DEFAULT_PARENT_CHUNK_VERSION
+):
+    """Embed a question for the answer cache, returning (cache key, embedding).
+    Multi-collection queries are keyed on all names and embedded with the first;
+    non-default chunk versions get their own key."""
+    if isinstance(collection_name, str):
+        collection_name = [collection_name]
+    retriever = get_retriever(collection_name[0])
+    embeddings = retriever.base_retriever.vectorstore.embedding_function
+    query_embedding = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+    cache_key = "+".join(collection_name)
+    if chunk_version != db.DEFAULT_PARENT_CHUNK_VERSION:
+        cache_key += f"@{chunk_version}"
+    return cache_key, query_embedding
+
+
+def get_cached_answer(
+    question: str,
+    collection_name,
+    chunk_version=db.DEFAULT_PARENT_CHUNK_VERSION,
+    threshold=ANSWER_CACHE_THRESHOLD,
+):
+    """Return a logged answer to a semantically equivalent question, if any."""
+    cache_key, query_embedding = embed_cache_question(
+        question, collection_name, chunk_version
+    )
+    nearest = db.get_nearest_qna(cache_key, db.get_corpus_version(), query_embedding)
+    if nearest is None:
+        return None
+    response, similarity = nearest
+    if similarity >= threshold:
+        return response
+    return None
+
+
+def cache_answer(
+    qna_id: str,
+    question: str,
+    collection_name,
+    chunk_version=db.DEFAULT_PARENT_CHUNK_VERSION,
+):
+    """Register a logged Q&A in the semantic answer cache."""
+    cache_key, query_embedding = embed_cache_question(
+        question, collection_name, chunk_version
+    )
+    db.insert_qna_embedding(
+        qna_id, cache_key, db.get_corpus_version(), query_embedding
+    )
+    return True
+
+
 def create_rag_context(parent_docs):
     """Create RAG context for LLM, including text excerpts, arxiv_codes,
     year of publication and citation counts."""
@@ -99,26 +212,65 @@ def create_rag_context(parent_docs):
     return rag_context
 
 
-def query_llmpedia(question: str, collection_name, model="GPT-3.5-Turbo"):
-    """Query LLMpedia via LLMChain."""
-    rag_prompt_custom = ChatPromptTemplate.from_messages(
-        [
-            ("system", ps.VS_SYSYEM_TEMPLATE),
-            ("human", "{question}"),
-        ]
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K, top_n=None):
+    """Merge ranked lists of hashable items by reciprocal rank fusion."""
+    scores = {}
+    for ranked_list in ranked_lists:
+        for rank, item in enumerate(ranked_list):
+            scores[item] = scores.get(item, 0) + 1 / (k + rank + 1)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return fused[:top_n] if top_n else fused
+
+
+async def aretrieve_child_ids(question: str, collection_name, timings: dict):
+    """Embed, search and rerank a question against one collection, timing each stage."""
+    compression_retriever = get_retriever(collection_name)
+    base_retriever = compression_retriever.base_retriever
+    store = base_retriever.vectorstore
+    stage_timings = timings.setdefault(collection_name, {})
+
+    st_time = time.perf_counter()
+    query_embedding = await asyncio.to_thread(
+        store.embedding_function.embed_query, question
+    )
+    stage_timings["embed"] = time.perf_counter() - st_time
+
+    st_time = time.perf_counter()
+    docs = await asyncio.to_thread(
+        store.similarity_search_by_vector,
+        query_embedding,
+        **base_retriever.search_kwargs,
+    )
+    stage_timings["search"] = time.perf_counter() - st_time
+
+    st_time = time.perf_counter()
+    docs = await asyncio.to_thread(
+        compression_retriever.base_compressor.compress_documents, docs, question
     )
+    stage_timings["rerank"] = time.perf_counter() - st_time
+
+    return [(doc.metadata["arxiv_code"], doc.metadata["chunk_id"]) for doc in docs]
+
 
-    rag_llm_chain = LLMChain(
-        llm=llm_map[model], prompt=rag_prompt_custom, verbose=False
+async def aretrieve_rag_context(
+    question: str, collection_names: list, timings: dict, chunk_version: str
+):
+    """Retrieve from all collections concurrently, fuse results and fetch parent chunks."""
+    st_time = time.perf_counter()
+    ranked_lists = await asyncio.gather(
+        *[aretrieve_child_ids(question, c, timings) for c in collection_names]
     )
-    compression_retriever = initialize_retriever(collection_name)
-    child_docs = compression_retriever.invoke(question)
+    top_n = max([len(ranked_list) for ranked_list in ranked_lists])
+    child_ids = reciprocal_rank_fusion(ranked_lists, top_n=top_n)
 
     ## Map to parent chunk (for longer context).
-    child_docs = [doc.metadata for doc in child_docs]
-    child_ids = [(doc["arxiv_code"], doc["chunk_id"]) for doc in child_docs]
-    parent_ids = db.get_arxiv_parent_chunk_ids(child_ids)
-    parent_docs = db.get_arxiv_chunks(parent_ids, source="parent")
+    fetch_time = time.perf_counter()
+    parent_docs = await asyncio.to_thread(
+        db.get_arxiv_parent_chunks, child_ids, chunk_version
+    )
+    timings["parent_fetch"] = time.perf_counter() - fetch_time
+    timings["total"] = time.perf_counter() - st_time
+
     parent_docs["published"] = pd.to_datetime(parent_docs["published"]).dt.year
     parent_docs.sort_values(
         by=["published", "citation_count"], ascending=False, inplace=True
@@ -128,6 +280,48 @@ def query_llmpedia(question: str, collection_name, model="GPT-3.5-Turbo"):
 
     ## Create custom prompt.
     rag_context = create_rag_context(parent_docs)
+    return rag_context
+
+
+def retrieve_rag_context(
+    question: str,
+    collection_name,
+    timings: dict = None,
+    chunk_version: str = db.DEFAULT_PARENT_CHUNK_VERSION,
+):
+    """Retrieve and format the parent chunks used as context for a question.
+    `collection_name` can be a list to fan out over several collections."""
+    if isinstance(collection_name, str):
+        collection_name = [collection_name]
+    timings = {} if timings is None else timings
+    return asyncio.run(
+        aretrieve_rag_context(question, collection_name, timings, chunk_version)
+    )
+
+
+def parse_rag_response(res: str):
+    """Extract the `Response` section of a (possibly partial) RAG output.
+    Returns (response, is_complete), with response None if the section has not started."""
+    if "Response\n" not in res:
+        return None, False
+    res_response = res.split("Response\n")[1]
+    is_complete = "###" in res_response
+    res_response = res_response.split("###")[0].rstrip("#").strip()
+    return res_response, is_complete
+
+
+def query_llmpedia(
+    question: str,
+    collection_name,
+    model="GPT-3.5-Turbo",
+    timings: dict = None,
+    chunk_version: str = db.DEFAULT_PARENT_CHUNK_VERSION,
+):
+    """Query LLMpedia via LLMChain."""
+    rag_llm_chain = get_rag_chain(model)
+    rag_context = retrieve_rag_context(
+        question, collection_name, timings, chunk_version
+    )
     res = rag_llm_chain.run(context=rag_context, question=question)
     res_response = res.split("Response\n")[1].split("###")[0].strip()
     content = au.add_links_to_text_blob(res_response)
@@ -135,6 +329,40 @@ def query_llmpedia(question: str, collection_name, model="GPT-3.5-Turbo"):
     return content
 
 
+def stream_rag_response(question: str, rag_context: str, model="GPT-3.5-Turbo"):
+    """Answer a question over a retrieved context, yielding the linked response
+    so far as tokens arrive."""
+    rag_llm_chain = get_rag_chain(model)
+    messages = rag_llm_chain.prompt.format_messages(
+        context=rag_context, question=question
+    )
+
+    res = ""
+    last_response = None
+    for chunk in rag_llm_chain.llm.stream(messages):
+        res += chunk.content if hasattr(chunk, "content") else chunk
+        res_response, is_complete = parse_rag_response(res)
+        if res_response is not None and res_response != last_response:
+            last_response = res_response
+            yield au.add_links_to_text_blob(res_response)
+        if is_complete:
+            break
+
+
+def stream_llmpedia(
+    question: str,
+    collection_name,
+    model="GPT-3.5-Turbo",
+    timings: dict = None,
+    chunk_version: str = db.DEFAULT_PARENT_CHUNK_VERSION,
+):
+    """Query LLMpedia, yielding the linked response so far as tokens arrive."""
+    rag_context = retrieve_rag_context(
+        question, collection_name, timings, chunk_version
+    )
+    yield from stream_rag_response(question, rag_context, model)
+
+
 def summarize_doc_chunk(paper_title: str, document: str, model="local"):
     """Summarize a paper by segments."""
     summarizer_prompt = ChatPromptTemplate.from_messages(
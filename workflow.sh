@@ -17,5 +17,9 @@ echo ">> [7] Chunking docs..."
 python workflow/07_doc_chunker.py
 echo ">> [8] Embedding chunks..."
 python workflow/08_rag_embedder.py
+echo ">> [8b] Building local vector indexes (if USE_LOCAL_VECTOR_INDEX)..."
+python workflow/k1_vector_index.py
+echo ">> [9] Refreshing app views..."
+python workflow/m0_refresh_views.py
 
 echo "Done! Please enjoy the rest of your day and spread love around your neighbourhood."
\ No newline at end of file
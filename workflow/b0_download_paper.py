@@ -8,14 +8,35 @@ os.chdir(os.environ.get("PROJECT_PATH"))
 
 import re, json
 import time
+import queue
+import threading
+import contextvars
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
 from langchain.callbacks import get_openai_callback
 
 import utils.paper_utils as pu
+import utils.rate_limit as rl
 import utils.vector_store as vs
 import utils.db as db
 
+## Workers per pipeline stage and max. papers waiting between stages.
+N_DOWNLOAD_WORKERS = 4
+N_EXTRACT_WORKERS = os.cpu_count()
+N_VERIFY_WORKERS = 4
+QUEUE_SIZE = 16
+
+## Min. seconds between requests to each host (arXiv API asks for 3s).
+HOST_INTERVALS = {pu.ARXIV_API_HOST: pu.ARXIV_DELAY_SECONDS, "arxiv.org": 1}
+
+## Parsed papers between gist queue updates.
+GIST_UPDATE_EVERY = 10
+
+STOP = object()
+
+
 def update_gist(gist_id, gist_filename, paper_list):
     """Update the gist with the current queue."""
     gist_url = pu.update_gist(
@@ -28,6 +49,84 @@ def update_gist(gist_id, gist_filename, paper_list):
     return gist_url
 
 
+def start_stage(fn, in_q, out_q, n_workers):
+    """Run `fn` over the items of `in_q` in worker threads, putting results on
+    `out_q`. Once `in_q` is exhausted and all workers are done, `out_q` is closed."""
+
+    def worker():
+        while True:
+            item = in_q.get()
+            if item is STOP:
+                in_q.put(STOP)
+                break
+            out_q.put(fn(item))
+
+    ## Threads inherit the caller's context (e.g. the OpenAI cost callback), and
+    ## are daemons so an error in the main loop does not leave the process hanging.
+    threads = [
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(worker,), daemon=True
+        )
+        for _ in range(n_workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    def close():
+        for thread in threads:
+            thread.join()
+        out_q.put(STOP)
+
+    threading.Thread(target=close, daemon=True).start()
+
+
+def download_paper(paper, session, limiter):
+    """Search the paper in Arxiv and download its PDF."""
+    try:
+        result = pu.search_arxiv_result(paper["paper_name"], limiter)
+        if result is None:
+            paper["status"] = "not_found"
+            return paper
+        limiter.acquire(result.pdf_url)
+        response = session.get(result.pdf_url, timeout=120)
+        response.raise_for_status()
+        paper["title"] = result.title
+        paper["arxiv_code"] = re.sub(r"v\d+$", "", result.entry_id.split("/")[-1])
+        paper["pdf"] = response.content
+    except Exception as e:
+        paper["status"] = "error"
+        paper["error"] = e
+    return paper
+
+
+def extract_paper(paper, executor):
+    """Extract and preprocess the PDF text (in a worker process)."""
+    if paper["status"]:
+        return paper
+    try:
+        content = executor.submit(pu.extract_pdf_text, paper.pop("pdf")).result()
+        paper["content"] = pu.preprocess_arxiv_doc(content)
+    except Exception as e:
+        paper["status"] = "error"
+        paper["error"] = e
+    return paper
+
+
+def verify_paper(paper):
+    """Verify it's an LLM paper."""
+    if paper["status"]:
+        return paper
+    try:
+        is_llm_paper = vs.verify_llm_paper(
+            paper["content"][:1500] + " ...[continued]..."
+        )
+        paper["status"] = "llm" if is_llm_paper["is_related"] else "nonllm"
+    except Exception as e:
+        paper["status"] = "error"
+        paper["error"] = e
+    return paper
+
+
 def main():
     vs.validate_openai_env()
     parsed_list = []
@@ -45,77 +144,88 @@ def main():
     paper_list = list(set(paper_list) - set(local_codes) - set(nonllm_papers))
     paper_list_iter = paper_list[:]
 
+    ## Pipeline: download -> extract -> verify, connected by bounded queues.
+    session = pu.get_http_session(pool_size=N_DOWNLOAD_WORKERS)
+    limiter = rl.HostRateLimiter(HOST_INTERVALS)
+    input_q = queue.Queue()
+    download_q = queue.Queue(maxsize=QUEUE_SIZE)
+    extract_q = queue.Queue(maxsize=QUEUE_SIZE)
+    results_q = queue.Queue()
+    for paper_name in paper_list_iter:
+        input_q.put({"paper_name": paper_name, "status": None})
+    input_q.put(STOP)
+
     ## Iterate.
     gist_url = None
-    with get_openai_callback() as cb:
-        for paper_name in tqdm(paper_list_iter):
-            time.sleep(10)
-            # existing = pu.check_if_exists(
-            #     paper_name, existing_paper_names, existing_paper_ids
-            # )
-            #
-            # ## Check if we already have the document.
-            # if existing:
-            #     print(f"\nSkipping '{paper_name}' as it is already in the database.")
-            #     ## Update gist.
-            #     parsed_list.append(paper_name)
-            #     paper_list = list(set(paper_list) - set(parsed_list))
-            #     gist_url = update_gist(gist_id, gist_filename, paper_list)
-            #     continue
-
-            ## Search content.
-            try:
-                new_doc = pu.search_arxiv_doc(paper_name)
-            except Exception as e:
-                print(f"\nFailed to search for '{paper_name}'. Skipping...")
-                print(e)
-                continue
-
-            if new_doc is None:
+    gist_pending = 0
+    st_time = time.time()
+    ## Extraction processes are spawned (not forked from a threaded process).
+    with get_openai_callback() as cb, ProcessPoolExecutor(
+        max_workers=N_EXTRACT_WORKERS, mp_context=mp.get_context("spawn")
+    ) as executor:
+        start_stage(
+            lambda p: download_paper(p, session, limiter),
+            input_q,
+            download_q,
+            N_DOWNLOAD_WORKERS,
+        )
+        start_stage(
+            lambda p: extract_paper(p, executor),
+            download_q,
+            extract_q,
+            N_EXTRACT_WORKERS,
+        )
+        start_stage(verify_paper, extract_q, results_q, N_VERIFY_WORKERS)
+
+        progress = tqdm(total=len(paper_list_iter))
+        while True:
+            paper = results_q.get()
+            if paper is STOP:
+                break
+            progress.update(1)
+            paper_name = paper["paper_name"]
+
+            if paper["status"] == "not_found":
                 print(f"\nCould not find '{paper_name}' in Arxiv. Skipping...")
                 continue
+            if paper["status"] == "error":
+                print(f"\nFailed to process '{paper_name}'. Skipping...")
+                print(paper["error"])
+                continue
 
-            new_meta = new_doc.metadata
-            new_content = pu.preprocess_arxiv_doc(new_doc.page_content)
-            title = new_meta["Title"]
-            arxiv_code = new_meta["entry_id"].split("/")[-1]
-            arxiv_code = re.sub(r"v\d+$", "", arxiv_code)
-
-            ## Verify it's an LLM paper.
-            is_llm_paper = vs.verify_llm_paper(new_content[:1500] + " ...[continued]...")
-            if not is_llm_paper["is_related"]:
+            title = paper["title"]
+            arxiv_code = paper["arxiv_code"]
+            if paper["status"] == "nonllm":
                 print(f"\n'{paper_name}' - '{title}' is not a LLM paper. Skipping...")
-                parsed_list.append(paper_name)
-                paper_list = list(set(paper_list) - set(parsed_list))
-                gist_url = update_gist(gist_id, gist_filename, paper_list)
                 ## Store in nonllm_arxiv_text.
-                pu.store_local(new_content, arxiv_code, "nonllm_arxiv_text", format="txt")
-                continue
-
-            ## Check if we have a summary locally.
-            local_paper_codes = os.path.join(
-                os.environ.get("PROJECT_PATH"), "data", "arxiv_text"
-            )
-            local_paper_codes = [
-                f.split(".json")[0] for f in os.listdir(local_paper_codes)
-            ]
-            if arxiv_code in local_paper_codes:
-                ## Update gist.
+                pu.store_local(
+                    paper["content"], arxiv_code, "nonllm_arxiv_text", format="txt"
+                )
+            elif arxiv_code in pu.get_local_arxiv_codes("arxiv_text"):
                 print(f"\nFound '{paper_name}' - '{title}' locally. Skipping...")
-                parsed_list.append(paper_name)
+            else:
+                ## Store.
+                pu.store_local(paper["content"], arxiv_code, "arxiv_text", format="txt")
+                print(f"\nSummary for '{paper_name}' - '{title}' stored locally.")
+
+            ## Update gist (in batches).
+            parsed_list.append(paper_name)
+            gist_pending += 1
+            if gist_pending >= GIST_UPDATE_EVERY:
                 paper_list = list(set(paper_list) - set(parsed_list))
                 gist_url = update_gist(gist_id, gist_filename, paper_list)
-                continue
-
-            ## Store.
-            pu.store_local(new_content, arxiv_code, "arxiv_text", format="txt")
-            print(f"\nSummary for '{paper_name}' - '{title}' stored locally.")
+                gist_pending = 0
+        progress.close()
 
-            ## Update gist.
-            parsed_list.append(paper_name)
+        if gist_pending > 0:
             paper_list = list(set(paper_list) - set(parsed_list))
             gist_url = update_gist(gist_id, gist_filename, paper_list)
 
+    elapsed = time.time() - st_time
+    print(
+        f"Processed {len(paper_list_iter)} papers in {elapsed:.1f}s "
+        f"({len(parsed_list)} parsed)."
+    )
     if gist_url:
         print(f"Done! Updated queue gist URL: {gist_url}")
     print(cb)
@@ -10,25 +10,72 @@ from tqdm import tqdm
 import utils.paper_utils as pu
 import utils.db as db
 
+meta_path = os.path.join(os.environ.get("PROJECT_PATH"), "data", "arxiv_meta")
+
+
+def fetch_batch(arxiv_codes):
+    """Fetch raw meta-data for a batch of codes, falling back to one code per
+    query if the batch request fails (e.g. on a malformed code)."""
+    try:
+        return {k: v._raw for k, v in pu.get_arxiv_info_batch(arxiv_codes).items()}
+    except Exception as e:
+        print(f"\nBatch request failed ({e}), retrying codes one by one...")
+    arxiv_meta = {}
+    for arxiv_code in arxiv_codes:
+        try:
+            arxiv_meta.update(
+                {k: v._raw for k, v in pu.get_arxiv_info_batch([arxiv_code]).items()}
+            )
+        except Exception as e:
+            print(f"\nCould not fetch '{arxiv_code}': {e}")
+    return arxiv_meta
+
 
 def main():
+    db.create_unique_index("arxiv_details", db.db_params)
     arxiv_codes = pu.get_local_arxiv_codes()
     done_codes = db.get_arxiv_id_list(db.db_params, "arxiv_details")
     arxiv_codes = list(set(arxiv_codes) - set(done_codes))
     arxiv_codes = sorted(arxiv_codes)[::-1]
 
-    for arxiv_code in tqdm(arxiv_codes):
-        arxiv_info = pu.get_arxiv_info(arxiv_code)
-        if arxiv_info is None:
-            print(f"\nCould not find '{arxiv_code}' in Arxiv meta-data. Skipping...")
+    ## Resume: meta-data stored locally on a previous run is not re-fetched.
+    local_codes = set(pu.get_local_arxiv_codes("arxiv_meta", ".json"))
+    cached_codes = [c for c in arxiv_codes if c in local_codes]
+    fetch_codes = [c for c in arxiv_codes if c not in local_codes]
+    print(
+        f"Found {len(arxiv_codes)} papers pending ({len(cached_codes)} stored locally)."
+    )
+
+    batches = [
+        fetch_codes[i : i + pu.ARXIV_BATCH_SIZE]
+        for i in range(0, len(fetch_codes), pu.ARXIV_BATCH_SIZE)
+    ]
+    batches = [(cached_codes, True)] + [(batch, False) for batch in batches]
+    items_added = 0
+    for batch, cached in tqdm(batches):
+        if len(batch) == 0:
             continue
-        processed_meta = pu.process_arxiv_data(arxiv_info._raw)
+        if cached:
+            arxiv_meta = {c: pu.load_local(c, meta_path, False, "json") for c in batch}
+        else:
+            arxiv_meta = fetch_batch(batch)
+
+        records = []
+        for arxiv_code in batch:
+            if arxiv_code not in arxiv_meta:
+                print(f"\nCould not find '{arxiv_code}' in Arxiv meta-data. Skipping...")
+                continue
+            if not cached:
+                pu.store_local(arxiv_meta[arxiv_code], arxiv_code, "arxiv_meta")
+            records.append(pu.process_arxiv_data(arxiv_meta[arxiv_code]))
 
         ## Store.
-        pu.store_local(arxiv_info._raw, arxiv_code, "arxiv_meta")
-        db.upload_to_db(processed_meta, pu.db_params, "arxiv_details")
+        items_added += db.upload_to_db(
+            records, pu.db_params, "arxiv_details", upsert=True
+        )
 
-    print("Done.")
+    print(f"Done. Added {items_added} papers.")
+    db.print_pool_stats()
 
 
 if __name__ == "__main__":
@@ -101,6 +101,7 @@ def main():
         summary_notes["tstp"] = pd.Timestamp.now()
         db.upload_df_to_db(summary_notes, "summary_notes", db.db_params)
 
+    db.print_pool_stats()
     print("Done!")
 
 
@@ -1,13 +1,16 @@
 import sys, os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from tqdm import tqdm
-import random
+import pandas as pd
 import time
 
 load_dotenv()
 sys.path.append(os.environ.get("PROJECT_PATH"))
 
 import utils.paper_utils as pu
+import utils.rate_limit as rl
 import utils.db as db
 
 semantic_map = {
@@ -18,43 +21,140 @@ semantic_map = {
     "influentialCitationCount": "influential_citation_count",
 }
 
+## Refresh all papers regardless of when they were last fetched.
 OVERRIDE = False
+## Papers fetched more than this many days ago are refreshed (oldest first).
+STALE_AFTER_DAYS = 1
+
+## Concurrent batch requests and request budget (per minute) for Semantic Scholar.
+SS_WORKERS = 2
+SS_REQUESTS_PER_MINUTE = 30
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 2
+
+
+def get_refresh_codes(arxiv_codes, snapshot):
+    """Order papers for refresh: never fetched first, then stale ones oldest first."""
+    fetch_times = {k: v["tstp"] for k, v in snapshot.items()}
+    new_codes = sorted(
+        [c for c in arxiv_codes if fetch_times.get(c) is None], reverse=True
+    )
+    cutoff = datetime.now() - timedelta(days=STALE_AFTER_DAYS)
+    stale_codes = [
+        c
+        for c in arxiv_codes
+        if fetch_times.get(c) is not None and (OVERRIDE or fetch_times[c] < cutoff)
+    ]
+    stale_codes = sorted(stale_codes, key=lambda c: fetch_times[c])
+    return new_codes + stale_codes
+
+
+def is_unchanged(ss_info, snapshot):
+    """Check if fetched citation counts match the last stored ones."""
+    previous = snapshot.get(ss_info["arxiv_code"])
+    if previous is None:
+        return False
+    return all(
+        [
+            ss_info.get(k) == previous[k]
+            for k in ["citation_count", "influential_citation_count"]
+        ]
+    )
+
+
+def fetch_batch(arxiv_codes, session, limiter):
+    """Fetch a batch of papers from Semantic Scholar, backing off on 429/5xx."""
+    return rl.retry_with_backoff(
+        lambda: pu.get_semantic_scholar_info_batch(arxiv_codes, session),
+        max_retries=MAX_RETRIES,
+        base_delay=RETRY_BASE_DELAY,
+        limiter=limiter,
+    )
+
 
 def main():
-    """ Load summaries and add missing ones."""
+    """ Load summaries and add missing (or refresh stale) citation info."""
     arxiv_codes = db.get_arxiv_id_list(db.db_params, "summaries")
-    done_codes = db.get_arxiv_id_list(db.db_params, "semantic_details")
-    if not OVERRIDE:
-        arxiv_codes = list(set(arxiv_codes) - set(done_codes))
-    arxiv_codes = sorted(arxiv_codes)[::-1]
+    db.create_citation_history()
+    db.create_unique_index("semantic_details", db.db_params)
+    snapshot = db.get_citation_snapshot(db.db_params)
+    arxiv_codes = get_refresh_codes(arxiv_codes, snapshot)
+    print(f"Found {len(arxiv_codes)} papers to fetch or refresh.")
+
+    batch_size = pu.SEMANTIC_SCHOLAR_BATCH_SIZE
+    batches = [
+        arxiv_codes[i : i + batch_size] for i in range(0, len(arxiv_codes), batch_size)
+    ]
+    session = pu.get_http_session(pool_size=SS_WORKERS)
+    limiter = rl.RateLimiter(requests_per_minute=SS_REQUESTS_PER_MINUTE)
 
     items_added = 0
+    items_unchanged = 0
     errors = 0
-    for arxiv_code in tqdm(arxiv_codes):
-        if db.check_in_db(arxiv_code, db.db_params, "semantic_details"):
-            if not OVERRIDE:
+    st_time = time.time()
+    with ThreadPoolExecutor(max_workers=SS_WORKERS) as executor:
+        futures = {
+            executor.submit(fetch_batch, batch, session, limiter): batch
+            for batch in batches
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            batch = futures[future]
+            try:
+                batch_info = future.result()
+            except Exception as e:
+                print(f"\nERROR: Semantic Scholar batch request failed: {e}")
+                errors += len(batch)
                 continue
-            else:
-                db.remove_from_db(arxiv_code, db.db_params, "semantic_details")
-
-        ## Get Semantic Scholar info.
-        ss_info = pu.get_semantic_scholar_info(arxiv_code)
-        if ss_info is None:
-            print(f"\nERROR: Could not find {arxiv_code} in Semantic Scholar.")
-            errors += 1
-            continue
-
-        ss_info = pu.transform_flat_dict(pu.flatten_dict(ss_info), semantic_map)
-        ss_info["arxiv_code"] = arxiv_code
-        pu.store_local(ss_info, arxiv_code, "semantic_meta")
-        db.upload_to_db(ss_info, db.db_params, "semantic_details")
-        items_added += 1
-        # print(f"\nAdded {arxiv_code} to semantic_details.")
-        time.sleep(0.005)
-
-    print(f"Process complete. Added {items_added} items in total.")
+
+            fetch_tstp = datetime.now()
+            records = []
+            unchanged_codes = []
+            for arxiv_code in batch:
+                if arxiv_code not in batch_info:
+                    errors += 1
+                    continue
+                ss_info = pu.transform_flat_dict(
+                    pu.flatten_dict(batch_info[arxiv_code]), semantic_map
+                )
+                ss_info["arxiv_code"] = arxiv_code
+                if is_unchanged(ss_info, snapshot):
+                    unchanged_codes.append(arxiv_code)
+                    continue
+                pu.store_local(ss_info, arxiv_code, "semantic_meta")
+                ss_info["tstp"] = fetch_tstp
+                records.append(ss_info)
+
+            ## Only changed counts are written (snapshot and history).
+            if len(unchanged_codes) > 0:
+                db.touch_citation_fetch(unchanged_codes, fetch_tstp, db.db_params)
+                items_unchanged += len(unchanged_codes)
+            items_added += db.upload_to_db(
+                records, db.db_params, "semantic_details", upsert=True
+            )
+            history_df = pd.DataFrame(
+                records,
+                columns=[
+                    "arxiv_code",
+                    "tstp",
+                    "citation_count",
+                    "influential_citation_count",
+                ],
+            )
+            db.upload_df_to_db(
+                history_df,
+                "citation_history",
+                db.db_params,
+                conflict_columns=["arxiv_code", "tstp"],
+            )
+
+    elapsed = time.time() - st_time
+    print(
+        f"Process complete. Added or updated {items_added} items "
+        f"({items_unchanged} unchanged) in {elapsed:.1f}s."
+    )
     if errors > 0:
         print(f"Encountered {errors} errors during processing.")
+    db.print_pool_stats()
 
 if __name__ == '__main__':
     main()
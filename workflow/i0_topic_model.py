@@ -191,6 +191,8 @@ def store_topics_and_embeddings(
     # df[["topic", "dim1", "dim2"]].to_pickle(topic_path)
     df.index.name = "arxiv_code"
     df.reset_index(inplace=True)
+    ## On refit the table is truncated and reloaded (the `papers` view depends
+    ## on it, so it cannot be dropped); refresh the view afterwards (m0 stage).
     if_exists_policy = "replace" if refit else "append"
     db.upload_df_to_db(
         df[["arxiv_code", "topic", "dim1", "dim2"]],
@@ -1,11 +1,12 @@
 import sys, os
 import json
+import time
 import shutil
 import os, re
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 load_dotenv()
@@ -15,185 +16,197 @@ os.chdir(os.environ.get("PROJECT_PATH"))
 
 import utils.paper_utils as pu
 import utils.db as db
+import utils.chunk_store as cs
 
 data_path = os.path.join(os.environ.get("PROJECT_PATH"), "data", "arxiv_text")
-meta_path = os.path.join(os.environ.get("PROJECT_PATH"), "data", "arxiv_meta")
-child_path = os.path.join(os.environ.get("PROJECT_PATH"), "data", "arxiv_chunks")
-parent_path = os.path.join(
-    os.environ.get("PROJECT_PATH"), "data", "arxiv_large_parent_chunks"
-)
-
-## Splitters setup.
-CHUNK_SIZE = 2000
-CHUNK_OVERLAP = 200
-PARENT_CHUNK_SIZE = 10000
-PARENT_CHUNK_OVERLAP = 1000
-VERSION_NAME = "10000_1000"
-
-version_name_map = {
-    "10000_1000": "arxiv_large_parent_chunks",
-    "2000_200": "arxiv_parent_chunks",
-}
 
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=CHUNK_SIZE,
-    chunk_overlap=CHUNK_OVERLAP,
-    length_function=len,
-    is_separator_regex=False,
-)
-
-parent_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=PARENT_CHUNK_SIZE,
-    chunk_overlap=PARENT_CHUNK_OVERLAP,
-    length_function=len,
-    is_separator_regex=False,
-)
-
-
-def process_document(arxiv_code, child_path, parent_path):
-    child_chunks = pu.load_local(arxiv_code, child_path, False, "json")
-    parent_chunks = pu.load_local(arxiv_code, parent_path, False, "json")
-    mapping = map_child_to_parent_by_content(child_chunks, parent_chunks)
-    return [
-        {"arxiv_code": arxiv_code, "child_id": k, "parent_id": v}
-        for k, v in mapping.items()
-    ]
+## Chunking versions, all produced in one pass over each paper.
+CHUNK_CONFIGS = [
+    {"chunk_size": 2000, "chunk_overlap": 200},
+    {"chunk_size": 10000, "chunk_overlap": 1000},
+]
+## Version that gets embedded; every other version is mapped to as a parent.
+CHILD_VERSION = "2000_200"
 
+## Chunking processes, and papers per COPY upload batch.
+N_WORKERS = os.cpu_count()
+UPLOAD_BATCH_SIZE = 250
 
-def parallel_process_mapping(mapping_codes, child_path, parent_path):
-    all_mappings = []
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        future_to_arxiv = {
-            executor.submit(process_document, code, child_path, parent_path): code
-            for code in mapping_codes
-        }
-        for future in tqdm(as_completed(future_to_arxiv), total=len(mapping_codes)):
-            arxiv_code = future_to_arxiv[future]
-            try:
-                mapping_list = future.result()
-                all_mappings.extend(mapping_list)
-            except Exception as e:
-                print(f"Document {arxiv_code} generated an exception: {e}")
-    mapping_df = pd.DataFrame.from_dict(all_mappings)
-    return mapping_df
+
+def get_version_name(config: dict) -> str:
+    return f"{config['chunk_size']}_{config['chunk_overlap']}"
 
 
-def map_child_to_parent_by_content(child_chunks, parent_chunks):
-    """Map child chunks to parent chunks by content."""
+splitters = {
+    get_version_name(config): RecursiveCharacterTextSplitter(
+        chunk_size=config["chunk_size"],
+        chunk_overlap=config["chunk_overlap"],
+        length_function=len,
+        is_separator_regex=False,
+    )
+    for config in CHUNK_CONFIGS
+}
+chunk_overlaps = {
+    get_version_name(config): config["chunk_overlap"] for config in CHUNK_CONFIGS
+}
+parent_versions = [v for v in splitters.keys() if v != CHILD_VERSION]
+
+
+def map_child_to_parent_by_offsets(child_spans, parent_spans):
+    """Map each child chunk to the parent chunk it overlaps the most (lowest
+    parent id on ties), sweeping both offset-sorted span lists once."""
     mapping = {}
+    children = sorted(enumerate(child_spans), key=lambda c: c[1][0])
+    parents = sorted(enumerate(parent_spans), key=lambda p: (p[1][0], p[0]))
+
+    p_idx = 0
+    for child_id, (child_st, child_end) in children:
+        while p_idx < len(parents) and parents[p_idx][1][1] <= child_st:
+            p_idx += 1
+        best_parent, best_overlap = None, 0
+        j = p_idx
+        while j < len(parents) and parents[j][1][0] < child_end:
+            parent_id, (parent_st, parent_end) = parents[j]
+            overlap = min(child_end, parent_end) - max(child_st, parent_st)
+            if overlap > best_overlap:
+                best_parent, best_overlap = parent_id, overlap
+            j += 1
+        if best_parent is not None:
+            mapping[child_id] = best_parent
 
-    for child in child_chunks:
-        child_seq = child["chunk_id"]
-        child_content = child["text"]
-        best_parent = max(
-            parent_chunks,
-            key=lambda parent: (
-                len(child_content)
-                if child_content in parent["text"]
-                else next(
-                    (
-                        len(child_content[:end])
-                        for end in range(len(child_content), 0, -1)
-                        if child_content[:end] in parent["text"]
-                    ),
-                    0,
-                )
-            ),
+    return mapping
+
+
+def chunk_document(arxiv_code, versions, with_text=False):
+    """Read a paper once and split it for all pending versions, storing spans
+    locally. Returns (arxiv_code, text if requested, span records) for upload."""
+    doc_txt = pu.load_local(arxiv_code, data_path, False, "txt")
+    span_records = []
+    for version in versions:
+        spans = cs.locate_spans(
+            doc_txt, splitters[version].split_text(doc_txt), chunk_overlaps[version]
         )
-        best_match_length = (
-            len(child_content)
-            if child_content in best_parent["text"]
-            else next(
-                (
-                    len(child_content[:end])
-                    for end in range(len(child_content), 0, -1)
-                    if child_content[:end] in best_parent["text"]
-                ),
-                0,
-            )
+        cs.store_spans(arxiv_code, version, spans)
+        span_records.extend(
+            [
+                (arxiv_code, version, chunk_id, start, end)
+                for chunk_id, (start, end) in enumerate(spans)
+            ]
         )
+    doc_txt = cs.normalize_text(doc_txt) if with_text else None
+    return arxiv_code, doc_txt, span_records
+
+
+def upload_chunk_batch(results):
+    """COPY a batch of chunking results (paper texts and spans) into DB."""
+    docs_df = pd.DataFrame(
+        [(code, doc_txt) for code, doc_txt, _ in results if doc_txt is not None],
+        columns=["arxiv_code", "text"],
+    )
+    spans_df = pd.DataFrame(
+        [record for _, _, records in results for record in records],
+        columns=["arxiv_code", "version", "chunk_id", "start_idx", "end_idx"],
+    )
+    db.upload_df_to_db(
+        docs_df, "arxiv_documents", pu.db_params, conflict_columns=["arxiv_code"]
+    )
+    db.upload_df_to_db(
+        spans_df,
+        "arxiv_chunk_spans",
+        pu.db_params,
+        conflict_columns=["arxiv_code", "version", "chunk_id"],
+    )
+    return len(spans_df)
+
+
+def process_document(arxiv_code, parent_version):
+    child_spans = cs.load_spans(arxiv_code, CHILD_VERSION)
+    parent_spans = cs.load_spans(arxiv_code, parent_version)
+    mapping = map_child_to_parent_by_offsets(child_spans, parent_spans)
+    return [
+        {"arxiv_code": arxiv_code, "child_id": k, "parent_id": v}
+        for k, v in mapping.items()
+    ]
 
-        if best_match_length > 0:
-            mapping[child_seq] = best_parent["chunk_id"]
 
-    return mapping
+def process_mapping(mapping_codes, parent_version):
+    all_mappings = []
+    for arxiv_code in tqdm(mapping_codes):
+        try:
+            all_mappings.extend(process_document(arxiv_code, parent_version))
+        except Exception as e:
+            print(f"Document {arxiv_code} generated an exception: {e}")
+    mapping_df = pd.DataFrame.from_dict(all_mappings)
+    return mapping_df
 
 
 def main():
     """Chunk arxiv docs into smaller blocks."""
     ## Get raw paper list.
     local_codes = pu.get_local_arxiv_codes()
-
-    ## Child chunks.
-    print("Creating child chunks...")
-    child_done = db.get_arxiv_id_list(pu.db_params, "arxiv_chunks")
-    child_codes = list(set(local_codes) - set(child_done))
-    print(f"Found {len(child_codes)} child papers pending.")
-
-    for arxiv_code in tqdm(child_codes):
-        ## Open doc and meta_data.
-        doc_txt = pu.load_local(arxiv_code, data_path, False, "txt")
-        doc_texts = text_splitter.split_text(doc_txt)
-        doc_chunks = [doc.replace("\n", " ") for doc in doc_texts]
-
-        ## Store document chunks in DB.
-        doc_chunks_df = pd.DataFrame.from_dict(doc_chunks)
-        doc_chunks_df["arxiv_code"] = arxiv_code
-        doc_chunks_df["chunk_id"] = doc_chunks_df.index
-        doc_chunks_df.columns = ["text", "arxiv_code", "chunk_id"]
-        db.upload_df_to_db(doc_chunks_df, "arxiv_chunks", pu.db_params)
-
-        ## Store document chunks in JSON.
-        doc_chunks_list = doc_chunks_df.to_dict(orient="records")
-        pu.store_local(doc_chunks_list, arxiv_code, child_path, relative=False)
-
-    ## Parent chunks.
-    print("Creating parent chunks...")
-    parent_table_name = version_name_map[VERSION_NAME]
-    parent_done = db.get_arxiv_id_list(pu.db_params, parent_table_name)
-    parent_codes = list(set(local_codes) - set(parent_done))
-    print(f"Found {len(parent_codes)} parent papers pending.")
-
-    for arxiv_code in tqdm(parent_codes):
-        ## Open doc and meta_data.
-        doc_txt = pu.load_local(arxiv_code, data_path, False, "txt")
-        doc_meta = pu.load_local(arxiv_code, meta_path, False, "json")
-        doc_texts = parent_splitter.split_text(doc_txt)
-        doc_chunks = [doc.replace("\n", " ") for doc in doc_texts]
-
-        ## Store document chunks in DB.
-        doc_chunks_df = pd.DataFrame.from_dict(doc_chunks)
-        doc_chunks_df["arxiv_code"] = arxiv_code
-        doc_chunks_df["chunk_id"] = doc_chunks_df.index
-        doc_chunks_df.columns = ["text", "arxiv_code", "chunk_id"]
-        db.upload_df_to_db(doc_chunks_df, parent_table_name, pu.db_params)
-
-        ## Store document chunks in JSON.
-        doc_chunks_list = doc_chunks_df.to_dict(orient="records")
-        pu.store_local(doc_chunks_list, arxiv_code, parent_path, relative=False)
-
-    ## Mapping of child-to-parent.
-    print("Mapping child-to-parent...")
-    ## ToDo: Allow version param here.
-    mapping_done = db.get_arxiv_id_list(pu.db_params, "arxiv_chunk_map")
-    mapping_codes = list(set(local_codes) - set(mapping_done))
-    print(f"Found {len(mapping_codes)} mapping papers pending.")
-
-    mapping_df = parallel_process_mapping(mapping_codes, child_path, parent_path)
-    mapping_df["version"] = VERSION_NAME
-    db.upload_df_to_db(mapping_df, "arxiv_chunk_map", pu.db_params)
-
-    # for arxiv_code in tqdm(mapping_codes):
-    #     ## Open doc and meta_data.
-    #     child_chunks = pu.load_local(arxiv_code, child_path, False, "json")
-    #     parent_chunks = pu.load_local(arxiv_code, parent_path, False, "json")
-    #     mapping = map_child_to_parent_by_content(child_chunks, parent_chunks)
-    #     mapping = [
-    #         {"arxiv_code": arxiv_code, "child_id": k, "parent_id": v}
-    #         for k, v in mapping.items()
-    #     ]
-    #     mapping_df = pd.DataFrame.from_dict(mapping)
-    #     db.upload_df_to_db(mapping_df, "arxiv_chunk_map", pu.db_params)
+    db.create_chunk_store_tables()
+
+    ## Chunk spans for every pending (paper, version), one read per paper.
+    print("Creating chunks...")
+    docs_done = set(db.get_arxiv_id_list(pu.db_params, "arxiv_documents"))
+    versions_done = {v: set(db.get_chunk_span_codes(v)) for v in splitters.keys()}
+    pending = {}
+    for arxiv_code in local_codes:
+        versions = [v for v in splitters.keys() if arxiv_code not in versions_done[v]]
+        if len(versions) > 0 or arxiv_code not in docs_done:
+            pending[arxiv_code] = versions
+    print(f"Found {len(pending)} papers pending.")
+
+    st_time = time.time()
+    upload_time = 0
+    n_chunks = 0
+    batch = []
+    with ProcessPoolExecutor(max_workers=N_WORKERS) as executor:
+        results = executor.map(
+            chunk_document,
+            pending.keys(),
+            pending.values(),
+            [code not in docs_done for code in pending.keys()],
+            chunksize=8,
+        )
+        for result in tqdm(results, total=len(pending)):
+            batch.append(result)
+            if len(batch) == UPLOAD_BATCH_SIZE:
+                upload_st = time.time()
+                n_chunks += upload_chunk_batch(batch)
+                upload_time += time.time() - upload_st
+                batch = []
+    if len(batch) > 0:
+        upload_st = time.time()
+        n_chunks += upload_chunk_batch(batch)
+        upload_time += time.time() - upload_st
+
+    elapsed = time.time() - st_time
+    print(
+        f"Chunked {len(pending)} papers into {n_chunks} chunks in {elapsed:.1f}s "
+        f"({len(pending) / max(elapsed, 1e-9):.1f} papers/sec, "
+        f"{n_chunks / max(elapsed, 1e-9):.1f} chunks/sec; "
+        f"{upload_time:.1f}s spent uploading)."
+    )
+
+    ## Mapping of child-to-parent, per parent version.
+    for parent_version in parent_versions:
+        print(f"Mapping child-to-parent ({parent_version})...")
+        mapping_done = db.get_chunk_span_codes(parent_version, "arxiv_chunk_map")
+        mapping_codes = list(set(local_codes) - set(mapping_done))
+        print(f"Found {len(mapping_codes)} mapping papers pending.")
+
+        mapping_df = process_mapping(mapping_codes, parent_version)
+        mapping_df["version"] = parent_version
+        db.upload_df_to_db(mapping_df, "arxiv_chunk_map", pu.db_params)
+    db.create_chunk_indexes()
+
+    for table_name, stats in db.get_upload_stats().items():
+        print(
+            f"{table_name}: uploaded {stats['rows']} rows "
+            f"({stats['rows_per_sec']:.0f} rows/sec)."
+        )
+    db.print_pool_stats()
 
 
 if __name__ == "__main__":
@@ -1,9 +1,7 @@
 from langchain.embeddings.huggingface import HuggingFaceEmbeddings
-from langchain.vectorstores.pgvector import PGVector
-from langchain.docstore.document import Document
 from langchain.embeddings import CohereEmbeddings
 
-from sqlalchemy.exc import IntegrityError, OperationalError
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from tqdm import tqdm
 from dotenv import load_dotenv
 import pandas as pd
@@ -15,13 +13,18 @@ from dotenv import load_dotenv
 
 load_dotenv()
 sys.path.append(os.environ.get("PROJECT_PATH"))
-chunk_path = os.path.join(os.environ.get("PROJECT_PATH"), "data", "arxiv_chunks")
 
 import utils.paper_utils as pu
+import utils.rate_limit as rl
 import utils.db as db
+import utils.chunk_store as cs
+from utils.custom_langchain import CachedDocumentEmbeddings
 
-MAX_RETRIES = 3
-RETRY_DELAY = 2
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 2
+
+## Chunking version (see j0_doc_chunker) whose chunks get embedded.
+CHUNK_VERSION = db.EMBEDDING_CHUNK_VERSION
 
 COLLECTION_NAMES = [
     "arxiv_vectors",
@@ -33,64 +36,165 @@ MODEL_NAME_MAP = {
     "arxiv_vectors_cv3": "embed-english-v3.0",
 }
 
+## Chunks embedded (and inserted) per request, per model.
+BATCH_SIZE_MAP = {
+    "thenlper/gte-large": 64,
+    "embed-english-v3.0": 96,
+}
 
-def main():
-    """Create embeddings for all arxiv chunks and upload them to DB."""
-    CONNECTION_STRING = (
-        f"postgresql+psycopg2://{pu.db_params['user']}:{pu.db_params['password']}"
-        f"@{pu.db_params['host']}:{pu.db_params['port']}/{pu.db_params['dbname']}"
+## Concurrent batches in flight and request/token budgets (per minute), per model.
+PROVIDER_LIMITS = {
+    "thenlper/gte-large": {
+        "workers": 1,
+        "requests_per_minute": None,
+        "tokens_per_minute": None,
+    },
+    "embed-english-v3.0": {
+        "workers": 4,
+        "requests_per_minute": 1000,
+        "tokens_per_minute": None,
+    },
+}
+
+
+def iter_chunk_batches(arxiv_codes: list, batch_size: int):
+    """Yield lists of (arxiv_code, chunk_id, text) chunks across papers."""
+    batch = []
+    for arxiv_code in arxiv_codes:
+        for chunk in cs.load_chunks(arxiv_code, CHUNK_VERSION):
+            batch.append((arxiv_code, chunk["chunk_id"], chunk["text"]))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def embed_batch(embeddings, batch: list, limiter: rl.RateLimiter):
+    """Embed a batch of chunks within the provider budget, backing off on 429/5xx."""
+    texts = [text for _, _, text in batch]
+    n_tokens = sum([len(text) for text in texts]) // 4
+    try:
+        return rl.retry_with_backoff(
+            lambda: embeddings.embed_documents(texts),
+            max_retries=MAX_RETRIES,
+            base_delay=RETRY_BASE_DELAY,
+            limiter=limiter,
+            tokens=n_tokens,
+        )
+    except Exception as e:
+        print(f"Encountered error on batch starting at {batch[0][0]}: {e}")
+        return None
+
+
+def process_batch(collection_name, embeddings, batch, limiter):
+    """Embed and upload one batch, returning the number of vectors added and
+    the codes of papers left incomplete (if embedding or inserting failed)."""
+    batch_codes = {arxiv_code for arxiv_code, _, _ in batch}
+    batch_embeddings = embed_batch(embeddings, batch, limiter)
+    if batch_embeddings is None:
+        return 0, batch_codes
+    records = [
+        (arxiv_code, chunk_id, embedding)
+        for (arxiv_code, chunk_id, _), embedding in zip(batch, batch_embeddings)
+    ]
+    try:
+        return db.bulk_insert_embeddings(collection_name, records), set()
+    except Exception as e:
+        print(f"Failed to insert batch starting at {batch[0][0]}: {e}")
+        return 0, batch_codes
+
+
+def process_collection(collection_name: str, position: int = 0):
+    """Embed all pending chunks of a collection with a bounded worker pool."""
+    model_name = MODEL_NAME_MAP[collection_name]
+    batch_size = BATCH_SIZE_MAP[model_name]
+    limits = PROVIDER_LIMITS[model_name]
+    limiter = rl.RateLimiter(
+        limits["requests_per_minute"], limits["tokens_per_minute"]
     )
-    for COLLECTION_NAME in COLLECTION_NAMES:
-        print(f"Processing {COLLECTION_NAME}...")
-        model_name = MODEL_NAME_MAP[COLLECTION_NAME]
 
-        if "embed-english" in model_name:
-            embeddings = CohereEmbeddings(
-                cohere_api_key=os.getenv("COHERE_API_KEY"), model=model_name
+    if "embed-english" in model_name:
+        embeddings = CohereEmbeddings(
+            cohere_api_key=os.getenv("COHERE_API_KEY"), model=model_name
+        )
+    else:
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model_name, encode_kwargs={"batch_size": batch_size}
+        )
+    embeddings = CachedDocumentEmbeddings(embeddings, model_name=model_name)
+
+    db.create_embedding_table(collection_name)
+    arxiv_codes = db.get_arxiv_id_embeddings(pu.db_params, collection_name)
+    local_codes = cs.list_codes(CHUNK_VERSION)
+    processing_codes = sorted(set(local_codes) - set(arxiv_codes))
+    print(f"{collection_name}: found {len(processing_codes)} papers pending.")
+
+    add_count = 0
+    failed_batches = 0
+    failed_codes = set()
+    st_time = time.time()
+    progress = tqdm(unit="chunk", desc=collection_name, position=position)
+    max_in_flight = limits["workers"] * 2
+    with ThreadPoolExecutor(max_workers=limits["workers"]) as executor:
+        futures = {}
+        for batch in iter_chunk_batches(processing_codes, batch_size):
+            if len(futures) >= max_in_flight:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    added, failed = future.result()
+                    add_count += added
+                    failed_batches += len(failed) > 0
+                    failed_codes |= failed
+                    progress.update(futures.pop(future))
+            future = executor.submit(
+                process_batch, collection_name, embeddings, batch, limiter
             )
-        else:
-            embeddings = HuggingFaceEmbeddings(model_name=model_name)
-
-        store = PGVector(
-            collection_name=COLLECTION_NAME,
-            connection_string=CONNECTION_STRING,
-            embedding_function=embeddings,
+            futures[future] = len(batch)
+        for future in futures:
+            added, failed = future.result()
+            add_count += added
+            failed_batches += len(failed) > 0
+            failed_codes |= failed
+            progress.update(futures[future])
+    progress.close()
+
+    ## Papers are marked done by having any vectors, so partially embedded ones
+    ## are removed to be fully re-embedded (from the cache) on the next run.
+    for arxiv_code in failed_codes:
+        db.remove_from_db(arxiv_code, pu.db_params, collection_name)
+
+    elapsed = time.time() - st_time
+    print(
+        f"{collection_name}: added {add_count} vectors in {elapsed:.1f}s "
+        f"({add_count / max(elapsed, 1e-9):.1f} chunks/sec)."
+    )
+    if failed_batches > 0:
+        print(
+            f"{collection_name}: {failed_batches} batches failed; "
+            f"{len(failed_codes)} papers left pending for the next run."
         )
+    cache_stats = embeddings.cache_stats()
+    print(
+        f"{collection_name}: {cache_stats['hits']} chunks reused from the embedding "
+        f"cache, {cache_stats['misses']} newly embedded."
+    )
+    return add_count
+
 
-        arxiv_codes = db.get_arxiv_id_embeddings(pu.db_params, COLLECTION_NAME)
-        local_codes = os.listdir(chunk_path)
-        local_codes = [code.replace(".json", "") for code in local_codes]
-        processing_codes = list(set(local_codes) - set(arxiv_codes))
-
-        for arxiv_code in tqdm(processing_codes):
-            chunks_fname = os.path.join(chunk_path, f"{arxiv_code}.json")
-            chunks_json = json.load(open(chunks_fname, "r"))
-            chunks_df = pd.DataFrame(chunks_json)
-            add_count = 0
-            for idx, row in chunks_df.iterrows():
-                chunk_text = row["text"]
-                metadata = row.drop("text").to_dict()
-                metadata["model"] = model_name
-                for attempt in range(MAX_RETRIES):
-                    try:
-                        store.add_documents(
-                            [Document(page_content=chunk_text, metadata=metadata)]
-                        )
-                        add_count += 1
-                        break
-                    except IntegrityError as e:
-                        continue
-                    except OperationalError as e:
-                        print(
-                            f"Encountered error on paper {metadata['arxiv_code']}: {e}"
-                        )
-                        if attempt < MAX_RETRIES - 1:
-                            time.sleep(RETRY_DELAY)
-                    continue
-            # if metadata:
-            #     print(f"Added {add_count} vectors for {metadata['arxiv_code']}.")
-
-        print("Process complete.")
+def main():
+    """Create embeddings for all arxiv chunks and upload them to DB."""
+    db.create_embedding_cache_table()
+    with ThreadPoolExecutor(max_workers=len(COLLECTION_NAMES)) as executor:
+        futures = [
+            executor.submit(process_collection, collection_name, position)
+            for position, collection_name in enumerate(COLLECTION_NAMES)
+        ]
+        for future in futures:
+            future.result()
+
+    db.print_pool_stats()
+    print("Process complete.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import sys, os
+from dotenv import load_dotenv
+import numpy as np
+import time
+
+load_dotenv()
+sys.path.append(os.environ.get("PROJECT_PATH"))
+
+import utils.vector_index as vi
+import utils.db as db
+
+COLLECTION_NAMES = [
+    "arxiv_vectors",
+    "arxiv_vectors_cv3",
+]
+
+## On-disk precision of the index and number of IVF lists (0 = exact search only).
+DTYPE = "float16"
+N_LISTS = 0
+
+## Compare local search against pgvector after building.
+BENCHMARK = False
+BENCHMARK_QUERIES = 50
+BENCHMARK_K = 20
+
+
+def benchmark(collection_name):
+    """Compare latency and top-k agreement of local vs. pgvector search."""
+    index = vi.LocalVectorIndex(collection_name)
+    rng = np.random.default_rng(42)
+    query_rows = rng.choice(len(index.vectors), min(BENCHMARK_QUERIES, len(index.vectors)), replace=False)
+
+    local_time, pg_time, overlap = 0, 0, 0
+    for row in query_rows:
+        query = np.asarray(index.vectors[row], dtype=np.float32)
+        st_time = time.perf_counter()
+        local_res = index.search(query, k=BENCHMARK_K)
+        local_time += time.perf_counter() - st_time
+
+        st_time = time.perf_counter()
+        pg_res = db.search_embeddings(collection_name, query, k=BENCHMARK_K)
+        pg_time += time.perf_counter() - st_time
+
+        local_keys = {
+            (index.metadata.iloc[i]["arxiv_code"], index.metadata.iloc[i]["chunk_id"])
+            for i, _ in local_res
+        }
+        pg_keys = {(r[0], r[1]) for r in pg_res}
+        overlap += len(local_keys & pg_keys) / BENCHMARK_K
+
+    n = len(query_rows)
+    print(f"Local: {1000 * local_time / n:.2f} ms/query.")
+    print(f"pgvector: {1000 * pg_time / n:.2f} ms/query.")
+    print(f"Top-{BENCHMARK_K} agreement: {overlap / n:.2%}.")
+
+
+def main():
+    """Build local vector indexes from the collection embedding tables."""
+    if not vi.USE_LOCAL_INDEX:
+        print("Local vector indexes are disabled (USE_LOCAL_VECTOR_INDEX). Skipping...")
+        return
+    for collection_name in COLLECTION_NAMES:
+        print(f"Processing {collection_name}...")
+        n_rows, batches = db.stream_collection_embeddings(collection_name)
+        if n_rows == 0:
+            print(f"No embeddings found for {collection_name}. Skipping...")
+            continue
+        index_dir = vi.build_index(
+            collection_name,
+            batches,
+            n_rows,
+            db.COLLECTION_DIMS[collection_name],
+            dtype=DTYPE,
+            n_lists=N_LISTS,
+        )
+        print(f"Stored {n_rows} vectors in {index_dir}.")
+        if BENCHMARK:
+            benchmark(collection_name)
+
+    print("Process complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os, sys
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.append(os.environ.get("PROJECT_PATH"))
+
+import utils.db as db
+
+
+def main(
+    collection_name: str,
+    method: str,
+    migrate: bool,
+    m: int,
+    ef_construction: int,
+    lists: int,
+):
+    """Create a collection's typed embedding table and (re)build its ANN index."""
+    db.create_embedding_table(collection_name)
+    if migrate:
+        print(f"Copying {collection_name} from langchain_pg_embedding...")
+        n_rows = db.migrate_collection_embeddings(collection_name)
+        print(f"Copied {n_rows} vectors.")
+
+    print(f"Building {method} index on {collection_name}...")
+    db.create_embedding_index(
+        collection_name,
+        method=method,
+        m=m,
+        ef_construction=ef_construction,
+        lists=lists,
+    )
+    print("Done.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create/rebuild the pgvector ANN index of an embedding collection."
+    )
+    parser.add_argument(
+        "collection_name",
+        type=str,
+        choices=list(db.COLLECTION_DIMS.keys()),
+        help="Name of the embedding collection.",
+    )
+    parser.add_argument(
+        "--method",
+        type=str,
+        default="hnsw",
+        choices=["hnsw", "ivfflat"],
+        help="ANN index type.",
+    )
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="Copy vectors from the LangChain PGVector tables first.",
+    )
+    parser.add_argument(
+        "--m", type=int, default=16, help="HNSW max connections per node."
+    )
+    parser.add_argument(
+        "--ef-construction",
+        type=int,
+        default=64,
+        help="HNSW build candidate list size.",
+    )
+    parser.add_argument(
+        "--lists", type=int, default=100, help="IVFFlat number of lists."
+    )
+    args = parser.parse_args()
+    main(
+        args.collection_name,
+        args.method,
+        args.migrate,
+        args.m,
+        args.ef_construction,
+        args.lists,
+    )
@@ -0,0 +1,22 @@
+import sys, os
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.append(os.environ.get("PROJECT_PATH"))
+
+import utils.db as db
+
+
+def main():
+    """Refresh the materialized views read by the app and create its cache tables."""
+    db.create_citation_history()
+    db.create_papers_view()
+    db.refresh_papers_view()
+    db.create_qna_embeddings_table()
+    db.create_query_embeddings_table()
+    db.print_pool_stats()
+    print("Done!")
+
+
+if __name__ == "__main__":
+    main()